@@ -1,8 +1,14 @@
-from agents.templates import BaseRole, BaseDynamicAction
+from agents.templates import BaseAgent, BaseDynamicAction, PromptTemplate, estimate_tokens
+from agents.executor import executor
+from agents.memory import Memory
+from agents import streaming, scheduler, tracing, dedup, parsing, cache
+from settings import settings
 from metagpt.schema import Message
-import json
+from pydantic import BaseModel
 from rich import print
 import asyncio
+import weakref
+from typing import Any, Callable, ClassVar
 
 
 class ChatAction(BaseDynamicAction):
@@ -10,19 +16,31 @@ class ChatAction(BaseDynamicAction):
     Simple chatbot action
     """
     name: str = "Chat"
+    prompt_template: ClassVar[PromptTemplate] = PromptTemplate(
+        '## CHAT HISTORY\n{context}\n## NEW PROMPT FROM USER\n{prompt}\n\nONLY ANSWER THE LATEST PROMPT:\n'
+    )
 
-    async def run(self, prompt: str):
-        rsp = await self._aask(prompt)
-        return rsp
+    async def run(self, **kwargs):
+        rsp = await self._aask(self.prompt_template.format(**kwargs))
+        return self.match_pattern(rsp)
 
 
-class ChatRole(BaseRole):
+class ChatRole(BaseAgent):
     """
     Simple chatbot role
     """
+    __slots__ = ('summary', 'history_budget', 'memories')
+    profile: ClassVar[str] = 'ChatRole'
+    action_types = (ChatAction,)
 
     def __init__(self):
-        super().__init__(actions=[ChatAction])
+        super().__init__()
+        # summary of the conversation before the latest turns, maintained by the team
+        self.summary: str = ''
+        # token budget for the chat history in prompts, None for no limit
+        self.history_budget: int | None = None
+        # latest turns of the conversation
+        self.memories: Memory = Memory()
 
     def set_history(self, history: list[tuple[str, str]]) -> None:
         """
@@ -31,50 +49,111 @@ class ChatRole(BaseRole):
         :param history: new message history
         :return: none
         """
+        # one memory per turn, like the turns remembered by run
+        memory = ''
         for role, message in history:
             if role == 'User':
+                if memory:
+                    self.memories.append(memory)
                 memory = f'\\[Prompt] {message} \\[/prompt]\n'
             elif role == 'Bot':
-                memory = f'\\[Answer] {message} \\[/Answer]\n'
-            self.rc.memory.add(Message(content=memory, role=role))
+                self.memories.append(f'{memory}\\[Answer] {message} \\[/Answer]\n')
+                memory = ''
+        if memory:
+            self.memories.append(memory)
 
-    async def run(self, *args, **kwargs) -> Message:
-        self.rc.todo = self.actions[0]
-        rsp = await self._act(prompt=kwargs.get('prompt'))
-        return rsp
+    def clear(self) -> None:
+        """
+        Forget the conversation
 
-    async def _act(self, *args, **kwargs) -> Message:
-        todo = self.rc.todo
+        :return: none
+        """
+        self.memories.clear()
+        self.summary = ''
 
-        user_input = kwargs.get('prompt')
-        prompt = (
-            """## CHAT HISTORY\n{context}\n## NEW PROMPT FROM USER\n{prompt}\n\nONLY ANSWER THE LATEST PROMPT:\n"""
-            .format(context=self.get_chat_history(), prompt=user_input))
+    def get_memories(self, k: int = 0) -> list[str]:
+        """
+        Latest turns of the conversation
 
-        rsp = await todo.run(prompt=prompt)
-        msg = Message(content=rsp, role=self.profile, cause_by=todo)
+        :param k: number of turns, 0 for all
+        :return: turns, oldest first
+        """
+        return self.memories.last(k)
 
-        self.rc.memory.add(
-            Message(f'\\[Prompt] {user_input} \\[/prompt]\n\\[Answer] {rsp} \\[/Answer]\n',
-                    role=self.profile,
-                    cause_by=todo)
-        )
+    async def run(self, prompt: str) -> Message:
+        todo = self.action(0)
+        rsp = await todo.run(context=self.get_chat_history(), prompt=prompt)
+        self.memories.append(f'\\[Prompt] {prompt} \\[/prompt]\n\\[Answer] {rsp} \\[/Answer]\n')
 
-        return msg
+        return Message(content=rsp, role=self.profile, cause_by=todo)
 
     def get_chat_history(self, k=20):
-        context = self.get_memories(k=k)
-        return '\n'.join(c.content for c in context)
+        """
+        Chat history for prompts: the summary of the earlier conversation followed by
+        the latest (at most k) turns verbatim, as many as fit into the token budget
+
+        :param k: maximum number of verbatim turns
+        :return: chat history
+        """
+        budget = self.history_budget - estimate_tokens(self.summary) if self.history_budget else None
+        turns: list[str] = list()
+        for memory in reversed(self.get_memories(k=k)):
+            if budget is not None:
+                budget -= estimate_tokens(memory)
+                # always keep the latest turn
+                if budget < 0 and turns:
+                    break
+            turns.append(memory)
+
+        context = '\n'.join(reversed(turns))
+        if self.summary:
+            context = f'\\[Summary of the earlier conversation] {self.summary} \\[/Summary]\n{context}'
+        return context
+
+    def _upgrade(self, fields: dict) -> dict:
+        return {
+            **super()._upgrade(fields),
+            "summary": fields.get('summary', ''),
+            "history_budget": fields.get('history_budget'),
+            "memories": [message.content for message in fields['rc'].memory.get()],
+        }
+
+    def __setstate__(self, state: dict) -> None:
+        super().__setstate__(state)
+        if not isinstance(self.memories, Memory):
+            # pickled with an unbounded list of turns
+            self.memories = Memory(self.memories)
+
+
+class SummarizeAction(BaseDynamicAction):
+    name: str = "Summarize"
+
+    async def run(self, **kwargs):
+        prompt = 'In the following section you will be given the summary of a conversation between a user and an ' \
+                 'AI ChatBot and the turns of the conversation that followed.\n' \
+                 'Write a new concise summary of the whole conversation. Keep all facts, names, numbers and ' \
+                 'decisions that might be needed to answer later prompts.\n' \
+                 'ONLY ANSWER WITH THE SUMMARY.\n\n' \
+                 f'##SUMMARY: \n{kwargs.get("summary") or "(empty)"}' \
+                 f'\n\n##FOLLOWING TURNS: \n{kwargs.get("turns")}\n\n'
+
+        rsp = await self._aask(prompt)
+
+        return rsp
 
 
 class SuperviseAction(BaseDynamicAction):
     name: str = "Supervise"
+    cache_responses: ClassVar[bool] = True
+    json_output: ClassVar[bool] = True
 
     async def run(self, **kwargs):
         pretext = 'In the following section you will be given a chat history, a prompt and an answer to the prompt by ' \
                   f'an AI ChatBot.\nDECIDE WHETHER THE ANSWER IS CORRECT AND APPROPRIATE OR NOT.\n' \
                   'UNDER ALL CIRCUMSTANCES ANSWER WITH THE FOLLOWING JSON:\n' \
-                  '{"correct": true or false, "reason": "The answer is incorrect and inappropriate because ..."}\n' \
+                  '{"correct": true or false, "score": 0 to 10, ' \
+                  '"reason": "The answer is incorrect and inappropriate because ..."}\n' \
+                  'Set "score" to the quality of the answer, from 0 (useless) to 10 (perfect).\n' \
                   'If the answer is correct and appropriate, set "correct" to true and "reason" to an empty string.\n' \
                   'If the answer is incorrect and inappropriate, set "correct" to false and "reason" to a string' \
                   'explaining why.\n\nThe chat history, prompt and answer are as follows:\n\n'
@@ -91,6 +170,8 @@ class SuperviseAction(BaseDynamicAction):
 
 class SuperviseVoteAction(BaseDynamicAction):
     name: str = "SuperviseVote"
+    cache_responses: ClassVar[bool] = True
+    json_output: ClassVar[bool] = True
 
     async def run(self, **kwargs):
         answers = '\n\n'.join('ANSWER ' + str(i) + ':\n' + response
@@ -106,24 +187,138 @@ class SuperviseVoteAction(BaseDynamicAction):
         return rsp
 
 
-class SupervisorRole(BaseRole):
+class SuperviseBatchAction(BaseDynamicAction):
+    name: str = "SuperviseBatch"
+    cache_responses: ClassVar[bool] = True
+
+    async def run(self, **kwargs):
+        pretext = 'In the following section you will be given a chat history, a prompt and multiple answers to the ' \
+                  'prompt by AI ChatBots.\nDECIDE FOR EVERY ANSWER WHETHER IT IS CORRECT AND APPROPRIATE OR NOT.\n' \
+                  'UNDER ALL CIRCUMSTANCES ANSWER WITH THE FOLLOWING JSON ARRAY, WITH ONE ENTRY PER ANSWER:\n' \
+                  '[{"index": index, "correct": true or false, "score": 0 to 10, "reason": "The answer is incorrect ' \
+                  'and inappropriate because ..."}, ...]\n' \
+                  'Set "index" to the index of the answer and "score" to its quality, ' \
+                  'from 0 (useless) to 10 (perfect).\n' \
+                  'If an answer is correct and appropriate, set "correct" to true and "reason" to an empty string.\n' \
+                  'If an answer is incorrect and inappropriate, set "correct" to false and "reason" to a string' \
+                  'explaining why.\n\nThe chat history, prompt and answers are as follows:\n\n'
+
+        answers = '\n\n'.join('##ANSWER ' + str(i) + ': \n' + answer for i, answer in enumerate(kwargs.get("answers")))
+        prompt = f'{pretext}\n##CHAT HISTORY: ' \
+                 f'\n{kwargs.get("chat_history")}' \
+                 f'\n\n##PROMPT: \n{kwargs.get("prompt")}' \
+                 f'\n\n{answers}\n\n'
+
+        rsp = await self._aask(prompt)
+
+        return rsp
+
+
+def parse_score(score) -> float | None:
+    """
+    Quality score of a verdict, clamped to [0, 10]
+
+    :param score: score given by the supervisor
+    :return: score or None if there is no valid score
+    """
+    try:
+        return min(max(float(score), 0.0), 10.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class Verdict(BaseModel):
+    """
+    Output of SuperviseAction
+    """
+    correct: bool
+    reason: str | None = None
+    # an invalid score doesn't invalidate the verdict
+    score: Any = None
+
+    def feedback(self) -> dict:
+        return {"correct": self.correct, "reason": self.reason or '', "score": parse_score(self.score)}
+
+
+class BatchVerdict(Verdict):
+    """
+    Entry of the output of SuperviseBatchAction
+    """
+    index: int
+
+
+class Vote(BaseModel):
+    """
+    Output of SuperviseVoteAction
+    """
+    chosen: int
+
+
+class SupervisorRole(BaseAgent):
     """
     Supervisor role
     """
+    __slots__ = ('seat',)
+    profile: ClassVar[str] = 'SupervisorRole'
+    action_types = (SuperviseAction, SuperviseVoteAction, SuperviseBatchAction)
 
     def __init__(self):
-        super().__init__(actions=[SuperviseAction, SuperviseVoteAction])
+        super().__init__()
+        # index in the team, set by the team; the supervisors share their actions, but not their responses
+        self.seat = 0
 
-    async def run(self, *args, **kwargs) -> Message:
-        self.rc.todo = self.actions[0]
-        rsp = await self._act(prompt=kwargs.get('prompt'), chat_history=kwargs.get('chat_history'),
-                              answer=kwargs.get('answer'))
+    async def run(self, prompt: str, answer: str, chat_history: str) -> Message:
+        rsp = await self._act(0, prompt=prompt, chat_history=chat_history, answer=answer)
         try:
-            rsp.content = json.loads(rsp.content)
-        except json.JSONDecodeError:
+            rsp.content = parsing.parse(rsp.content, Verdict).feedback()
+        except parsing.ParseError:
+            print(f'[bold red]invalid feedback from supervisor[/]')
             rsp.content = {"correct": False, "reason": "Supervisor failed"}
         return rsp
 
+    async def judge(self, prompt: str, answers: list[str], chat_history: str) -> Message:
+        """
+        Judge multiple answers to the same prompt in a single call
+
+        :param prompt: The prompt for the answers
+        :param answers: answers to judge
+        :param chat_history: Chat history
+        :return: one feedback per answer (json), None if the output could not be parsed
+        """
+        rsp = await self._act(2, prompt=prompt, answers=answers, chat_history=chat_history)
+
+        # the first JSON value with a verdict for every answer, skipping e.g. bracketed prose before it
+        for verdicts in parsing.values(rsp.content):
+            try:
+                rsp.content = self.__feedbacks(verdicts, len(answers))
+                return rsp
+            except parsing.ParseError:
+                continue
+        print(f'[bold red]invalid batch feedback from supervisor[/]')
+        rsp.content = None
+        return rsp
+
+    @staticmethod
+    def __feedbacks(verdicts: Any, count: int) -> list[dict]:
+        """
+        Feedbacks from the output of SuperviseBatchAction
+
+        :param verdicts: JSON value
+        :param count: number of answers
+        :return: one feedback per answer
+        """
+        if isinstance(verdicts, dict):
+            # wrapped in an object, e.g. {"verdicts": [...]}
+            verdicts = next((value for value in verdicts.values() if isinstance(value, list)), verdicts)
+        feedbacks: list[dict | None] = [None] * count
+        for verdict in parsing.validate(verdicts, list[BatchVerdict]):
+            if not 0 <= verdict.index < count:
+                raise parsing.ParseError(f"Invalid answer index {verdict.index}")
+            feedbacks[verdict.index] = verdict.feedback()
+        if None in feedbacks:
+            raise parsing.ParseError("Not all answers were judged")
+        return feedbacks
+
     async def vote(self, prompt: str, responses: list[str]) -> Message:
         """
         Cast a vote upon the best response for the given prompt
@@ -132,35 +327,121 @@ class SupervisorRole(BaseRole):
         :param responses: responses to vote on
         :return: the voted response (json)
         """
-        self.rc.todo = self.actions[1]
-        rsp = await self._act(prompt=prompt, responses=responses)
+        rsp = await self._act(1, prompt=prompt, responses=responses)
 
         try:
-            rsp.content = json.loads(rsp.content)
-            if not isinstance(rsp.content.get('chosen'), int):
+            vote = parsing.parse(rsp.content, Vote)
+            if not 0 <= vote.chosen < len(responses):
                 print('[bold orange]no answer chosen[/]')
-                raise ValueError("No answer chosen")
-        except (json.JSONDecodeError, ValueError):
+                raise parsing.ParseError("No answer chosen")
+            rsp.content = {"chosen": vote.chosen}
+        except parsing.ParseError:
             print(f'[bold red]invalid feedback from supervisor[/]')
             rsp.content = {"chosen": -1}
         return rsp
 
-    async def _act(self, *args, **kwargs) -> Message:
-        todo = self.rc.todo
+    async def _act(self, index: int, **kwargs) -> Message:
+        todo = self.action(index)
 
-        rsp = await todo.run(*args, **kwargs)
+        token = cache.scope.set(f'{self.profile}:{getattr(self, "seat", 0)}')
+        try:
+            rsp = await todo.run(**kwargs)
+        finally:
+            cache.scope.reset(token)
         msg = Message(content=rsp, role=self.profile, cause_by=todo)
 
         return msg
 
 
+# background tasks (e.g. history compaction) and the teams currently compacting their history
+_background: set[asyncio.Task] = set()
+_compacting: weakref.WeakSet = weakref.WeakSet()
+# shared by the compactions of all teams, see summarizer
+_summarizer: SummarizeAction | None = None
+
+
+def summarizer() -> SummarizeAction:
+    """
+    Shared SummarizeAction (and its LLM client), like the actions of the agents, see BaseAgent.action
+
+    :return: action
+    """
+    global _summarizer
+    if _summarizer is None:
+        _summarizer = SummarizeAction()
+    return _summarizer
+
+
 class Team:
+    # class level defaults so that teams pickled before an option existed still load
+    race: bool = False
+    batch_judge: bool = False
+    summary: str = ''
+    summarized: int = 0
+    # history entries dropped from the memories of the agents (they only live on in the summary)
+    trimmed: int = 0
+    history_budget: int | None = 1024
+    verbatim_turns: int = 4
+    policy: str = settings['supervision']['policy']
+    quorum: int | None = settings['supervision']['quorum']
+    dedup: bool = settings['dedup']['enabled']
+    selection: str = settings['selection']['mode']
+    tie_margin: float = settings['selection']['tie_margin']
+    # called when a background compaction changed the summary, e.g. to save the session
+    on_compacted: Callable[[], None] | None = None
+
+    # supervision policies
+    POLICIES = ('unanimous', 'majority', 'k_of_n')
+    # how the best of multiple correct responses is picked
+    SELECTIONS = ('vote', 'score')
+
     def __init__(self, agents: list[ChatRole] | tuple[ChatRole],
                  supervisors: list[SupervisorRole] | tuple[SupervisorRole],
-                 history: list[tuple[str, str]] = None):
+                 history: list[tuple[str, str]] = None, race: bool = False, batch_judge: bool = False,
+                 history_budget: int | None = 1024, verbatim_turns: int = 4, policy: str | None = None,
+                 quorum: int | None = None, dedup: bool | None = None, selection: str | None = None,
+                 tie_margin: float | None = None):
+        """
+        Constructor for Team class
+
+        :param agents: agents generating answers
+        :param supervisors: supervisors judging the answers
+        :param history: chat history
+        :param race: return the first answer all supervisors approve and cancel the remaining calls
+        :param batch_judge: let every supervisor judge all answers in a single call
+        :param history_budget: token budget for the chat history in prompts, None for no limit
+        :param verbatim_turns: number of latest turns kept verbatim, older turns are folded into a summary
+        :param policy: approvals an answer needs: unanimous, majority or k_of_n (defaults to the settings)
+        :param quorum: number of approvals needed with the k_of_n policy (defaults to the settings)
+        :param dedup: judge and vote on near-duplicate answers only once (defaults to the settings)
+        :param selection: how the best of multiple correct answers is picked: vote, or score to pick it by the
+                          scores from judging and vote only on ties (defaults to the settings)
+        :param tie_margin: maximum score difference of answers that count as a tie (defaults to the settings)
+        """
+        policy = policy or settings['supervision']['policy']
+        if policy not in self.POLICIES:
+            raise ValueError(f'Unknown supervision policy \'{policy}\'')
+        selection = selection or settings['selection']['mode']
+        if selection not in self.SELECTIONS:
+            raise ValueError(f'Unknown selection mode \'{selection}\'')
         self.agents = agents
         self.supervisors = supervisors
+        for i, supervisor in enumerate(supervisors):
+            supervisor.seat = i
         self._history = history or list()
+        self.race = race
+        self.batch_judge = batch_judge
+        self.history_budget = history_budget
+        self.verbatim_turns = verbatim_turns
+        self.policy = policy
+        self.quorum = quorum or settings['supervision']['quorum']
+        self.dedup = settings['dedup']['enabled'] if dedup is None else dedup
+        self.selection = selection
+        self.tie_margin = settings['selection']['tie_margin'] if tie_margin is None else tie_margin
+        self.summary = ''
+        self.summarized = 0
+        for agent in self.agents:
+            agent.history_budget = history_budget
 
     @property
     def history(self):
@@ -179,19 +460,34 @@ class Team:
 
     async def __supervisors_run(self, prompt, answer, chat_history) -> list[dict]:
         """
-        Run all supervisors in team on the given prompt
+        Run the supervisors in team on the given prompt until the supervision policy decides the outcome,
+        the remaining supervisor calls are cancelled
 
         :param prompt: Prompt that answer was generated for
         :param answer: Answer generated by the agent
         :param chat_history: Chat history
-        :return: supervisor feedbacks
+        :return: supervisor feedbacks received until the outcome was decided
         """
+        if answer is None:
+            # the agent failed, nothing to judge
+            return [{"correct": False, "reason": "No answer was given"}]
+
+        # judge as the verdicts come in, stop once the outcome is decided
+        pending = {
+            asyncio.create_task(executor.call(supervisor.run(prompt=prompt, answer=answer, chat_history=chat_history)))
+            for supervisor in self.supervisors
+        }
         feedbacks: list[dict] = list()
-        promises = list()
-        for supervisor in self.supervisors:
-            promises.append(supervisor.run(prompt=prompt, answer=answer, chat_history=chat_history))
-        for result in asyncio.gather(promises):
-            feedbacks.append(result.content)
+        try:
+            while pending and self.__decided(feedbacks) is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    feedbacks.append(result.content if result else {"correct": False, "reason": "Supervisor failed"})
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
 
         return feedbacks
 
@@ -205,84 +501,269 @@ class Team:
         :param agent: agent to rerun
         :return: agent response
         """
+        # only rejecting feedbacks carry a reason
+        reasons = [feedback.get("reason") or '' for feedback in feedbacks if not feedback.get('correct')]
         feedback_prompt = f'A supervisor has concluded that your previous prompt did not match the requirements of ' \
                           f'the prompt \'{prompt}\' for the following reasons: \n' + \
-                          '\n'.join(feedback.get("reason") for feedback in feedbacks) + \
+                          '\n'.join(reasons) + \
                           f'\nProvide a new better answer to following prompt: \n{prompt}\n' \
                           f'DO NOT APOLOGIZE FOR YOUR PREVIOUS ANSWER\n'
 
         response = (await agent.run(prompt=feedback_prompt)).content
         return response
 
-    async def __supervised_run_all(self, prompt: str, response_feedbacks: list[list[dict]]) -> list[str]:
+    async def __supervised_run_all(self, prompt: str, response_feedbacks: list[list[dict]],
+                                   indices: list[int]) -> list[str | None]:
         """
-        Run all agents in the team with the feedbacks from the supervisors and get the responses
+        Rerun the given agents in the team with the feedbacks from the supervisors and get the responses
 
         :param prompt: the original prompt
         :param response_feedbacks: list of feedbacks for each response
-        :return: list of new responses
+        :param indices: indices of the agents to rerun
+        :return: list of new responses in the order of indices (None for agents that failed)
         """
-        responses: list[str] = list()
-        promises = list()
-        for feedbacks, agent in zip(response_feedbacks, self.agents):
-            promises.append(self.__supervised_run(prompt, feedbacks, agent))
-        for result in asyncio.gather(promises):
-            responses.append(result)
+        responses: list[str | None] = await executor.gather(
+            self.__supervised_run(prompt, response_feedbacks[i], self.agents[i]) for i in indices
+        )
 
         return responses
 
-    async def __supervisor_judge(self, prompt: str, responses: list[str]) -> list[list[dict]]:
+    async def __supervisor_judge(self, prompt: str, responses: list[str | None],
+                                 indices: list[int]) -> list[list[dict]]:
         """
-        Creates new feedback for each response
+        Creates new feedback for the given responses
 
         :param prompt: the original prompt
         :param responses: list of responses generated by the agents
-        :return: list of feedbacks
+        :param indices: indices of the responses to judge
+        :return: list of feedbacks in the order of indices
+        """
+        answered = [i for i in indices if responses[i] is not None]
+        # near-duplicate responses share the verdict on the first of them
+        clusters = self.__clusters(responses, answered)
+        representatives = [cluster[0] for cluster in clusters]
+        if len(representatives) < len(answered):
+            print(f'[bold cyan]Judging {len(representatives)} distinct of {len(answered)} responses[/]')
+
+        if self.batch_judge and len(representatives) > 1:
+            feedbacks = await self.__supervisor_batch_judge(prompt, responses, representatives)
+        else:
+            # not routed through the executor itself, the supervisor calls inside are
+            feedbacks = list(await asyncio.gather(*(
+                self.__supervisors_run(prompt=prompt, answer=responses[i],
+                                       chat_history=self.agents[i].get_chat_history())
+                for i in representatives
+            )))
+
+        by_index = {i: list(cluster_feedbacks) for cluster, cluster_feedbacks in zip(clusters, feedbacks)
+                    for i in cluster}
+        return [by_index.get(i, [{"correct": False, "reason": "No answer was given"}]) for i in indices]
+
+    def __clusters(self, responses: list[str | None], indices: list[int]) -> list[list[int]]:
+        """
+        Group the given responses into near-duplicates (one group per response if dedup is off)
+
+        :param responses: list of responses
+        :param indices: indices of the responses to group, must not be None
+        :return: groups of indices, the first index of a group is its representative
         """
-        response_feedbacks: list[list[dict]] = list()
-        promises = list()
-        for i, (response, agent) in enumerate(zip(responses, self.agents)):
-            promises.append(self.__supervisors_run(prompt=prompt, answer=response,
-                                                   chat_history=agent.get_chat_history()))
-        for result in asyncio.gather(promises):
-            response_feedbacks.append(result)
-        return response_feedbacks
+        if not self.dedup:
+            return [[i] for i in indices]
+        return [[indices[j] for j in group] for group in dedup.cluster([responses[i] for i in indices])]
+
+    async def __supervisor_batch_judge(self, prompt: str, responses: list[str | None],
+                                       indices: list[int]) -> list[list[dict]]:
+        """
+        Let every supervisor judge all given responses in a single call.
+        Supervisors whose output can't be parsed fall back to judging every response on its own.
+
+        :param prompt: the original prompt
+        :param responses: list of responses generated by the agents
+        :param indices: indices of the responses to judge
+        :return: list of feedbacks in the order of indices
+        """
+        answered = [i for i in indices if responses[i] is not None]
+        answers = [responses[i] for i in answered]
+        # the agents share the prompts, so the history of the first answering agent stands in for all of them
+        chat_history = self.agents[answered[0]].get_chat_history()
+
+        results = await executor.gather(supervisor.judge(prompt, answers, chat_history)
+                                        for supervisor in self.supervisors)
+        # fall back to per answer judging, the calls of all failed supervisors run together
+        failed = [k for k, result in enumerate(results) if not result or result.content is None]
+        fallback = await executor.gather(
+            self.supervisors[k].run(prompt=prompt, answer=responses[i], chat_history=self.agents[i].get_chat_history())
+            for k in failed for i in answered
+        )
+        verdicts: list[list[dict]] = [result.content if result and result.content is not None else None
+                                      for result in results]
+        for n, k in enumerate(failed):
+            verdicts[k] = [feedback.content if feedback else {"correct": False, "reason": "Supervisor failed"}
+                           for feedback in fallback[n * len(answered):(n + 1) * len(answered)]]
+
+        by_index = {i: [verdict[j] for verdict in verdicts] for j, i in enumerate(answered)}
+        return [by_index.get(i, [{"correct": False, "reason": "No answer was given"}]) for i in indices]
 
     async def __supervisor_vote(self, prompt: str, responses: list[str]) -> str:
         """
-        If multiple responses are agreed upon by all supervisors, let the supervisors vote on the best response
+        If multiple responses are approved, let the supervisors vote on the best distinct response
 
         :param prompt: the original prompt
         :param responses: list of responses up for vote
         :return: the voted response
         """
+        # only distinct responses are up for vote, the size of their cluster breaks ties
+        clusters = self.__clusters(responses, list(range(len(responses))))
+        candidates = [responses[cluster[0]] for cluster in clusters]
+        if len(candidates) == 1:
+            return candidates[0]
+
         # gather votes
-        votes: list[int] = list()
-        promises = list()
-        for supervisor in self.supervisors:
-            promises.append(supervisor.vote(prompt, responses))
-        for result in asyncio.gather(promises):
-            votes.append(result.content.get('chosen'))
-
-        # get response with most votes
-        # if it's a tie, a random one will be chosen
-        winner: int = max(set(votes), key=votes.count)
-        return responses[winner]
+        results = await executor.gather(supervisor.vote(prompt, candidates) for supervisor in self.supervisors)
+        votes: list[int] = [result.content.get('chosen') for result in results
+                            if result and 0 <= result.content.get('chosen') < len(candidates)]
+        if not votes:
+            print('[bold red]all supervisors failed to vote[/]')
+
+        # get response with most votes, if it's a tie the one given by the most agents wins
+        winner: int = max(range(len(candidates)), key=lambda j: (votes.count(j), len(clusters[j])))
+        return candidates[winner]
+
+    @property
+    def __required(self) -> int:
+        """
+        Number of approvals an answer needs under the supervision policy
+
+        :return: required approvals
+        """
+        n = len(self.supervisors)
+        if self.policy == 'majority':
+            return n // 2 + 1
+        if self.policy == 'k_of_n':
+            return min(self.quorum or n, n)
+        return n
+
+    def __decided(self, feedbacks: list[dict]) -> bool | None:
+        """
+        Outcome of the (possibly incomplete) feedbacks for a response
+
+        :param feedbacks: feedbacks received so far
+        :return: True if approved, False if rejected, None if the outstanding feedbacks still matter
+        """
+        approvals = sum(1 for feedback in feedbacks if feedback.get('correct'))
+        if len(feedbacks) - approvals > len(self.supervisors) - self.__required:
+            return False
+        if approvals >= self.__required:
+            return True
+        return None
+
+    def __approved(self, feedbacks: list[dict]) -> bool:
+        """
+        Checks whether enough supervisors agree that a response is correct
+
+        :param feedbacks: feedbacks for the response
+        :return: True if approved, False otherwise
+        """
+        return self.__decided(feedbacks) is True
+
+    def __check_response_feedbacks(self, response_feedbacks: list[list[dict]]) -> list[int]:
+        """
+        Checks the feedback on all responses and returns the ones approved under the supervision policy
+
+        :param response_feedbacks: list of feedbacks for each response
+        :return: indices of the correct responses
+        """
+        return [i for i, feedbacks in enumerate(response_feedbacks) if self.__approved(feedbacks)]
 
     @staticmethod
-    async def __check_response_feedbacks(responses: list[str], response_feedbacks: list[list[dict]]) -> list[str]:
+    def __score(feedbacks: list[dict]) -> float | None:
+        """
+        Mean quality score the supervisors gave a response
+
+        :param feedbacks: feedbacks for the response
+        :return: score or None if no supervisor scored the response
+        """
+        scores = [feedback['score'] for feedback in feedbacks if feedback.get('score') is not None]
+        return sum(scores) / len(scores) if scores else None
+
+    async def __select(self, prompt: str, responses: list[str | None], response_feedbacks: list[list[dict]],
+                       indices: list[int]) -> str:
         """
-        Checks the feedback on all responses and returns the first one which all supervisors agree is correct
+        Pick the best of multiple correct responses: by the scores from judging if the selection mode is score
+        and one response is ahead by more than the tie margin, by a vote of the supervisors otherwise
 
+        :param prompt: the original prompt
+        :param responses: list of responses
+        :param response_feedbacks: list of feedbacks for each response
+        :param indices: indices of the correct responses
+        :return: the selected response
+        """
+        if self.selection == 'score':
+            scores = {i: self.__score(response_feedbacks[i]) for i in indices}
+            if None not in scores.values():
+                best = max(scores.values())
+                # only the responses close to the best are up for vote
+                indices = [i for i in indices if best - scores[i] <= self.tie_margin]
+                if len(indices) == 1:
+                    print(f'[bold green]Response {indices[0] + 1} has the best score ({best:.1f})[/]')
+                    return responses[indices[0]]
+
+        print(f'[bold cyan]Supervisors voting on best response[/]')
+        streaming.emit('voting', candidates=len(indices))
+        with tracing.span('team.vote', candidates=len(indices)):
+            return await self.__supervisor_vote(prompt, [responses[i] for i in indices])
+
+    async def __attempt(self, prompt: str, i: int,
+                        feedbacks: list[dict] | None = None) -> tuple[str | None, list[dict]]:
+        """
+        Generate a response with a single agent and let the supervisors judge it right away
+
+        :param prompt: Prompt to generate output for
+        :param i: index of the agent to run
+        :param feedbacks: feedbacks on the previous response of the agent, if given the agent reruns with them
+        :return: the response and its feedbacks
+        """
+        agent = self.agents[i]
+        if feedbacks is None:
+            result = await executor.call(streaming.draft(agent.run(prompt=prompt), i))
+            response = result.content if result else None
+        else:
+            response = await executor.call(streaming.draft(self.__supervised_run(prompt, feedbacks, agent), i))
+        feedbacks = await self.__supervisors_run(prompt=prompt, answer=response, chat_history=agent.get_chat_history())
+        return response, feedbacks
+
+    async def __race(self, prompt: str, responses: list[str | None], response_feedbacks: list[list[dict]],
+                     indices: list[int], retry: bool = False) -> str | None:
+        """
+        Generate responses with the given agents and judge every response as soon as it arrives.
+        Stops at the first approved response, outstanding agent and supervisor calls are cancelled.
+        responses and response_feedbacks are updated in place.
+
+        :param prompt: Prompt to generate output for
         :param responses: list of responses
         :param response_feedbacks: list of feedbacks for each response
-        :return: list of correct responses
+        :param indices: indices of the agents to run
+        :param retry: rerun the agents with the feedbacks on their previous responses
+        :return: the first approved response, None if nothing was approved
         """
-        correct_responses: list[str] = list()
-        for response, feedbacks in zip(responses, response_feedbacks):
-            if all(feedback.get('correct') for feedback in feedbacks):
-                correct_responses.append(response)
-        return correct_responses
+        pending = {
+            asyncio.create_task(self.__attempt(prompt, i, response_feedbacks[i] if retry else None)): i
+            for i in indices
+        }
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    i = pending.pop(task)
+                    responses[i], response_feedbacks[i] = task.result()
+                    if self.__approved(response_feedbacks[i]):
+                        print(f'[bold green]Response {i + 1} approved, cancelling {len(pending)} remaining[/]')
+                        return responses[i]
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        return None
 
     async def __run(self, prompt) -> str:
         """
@@ -291,45 +772,178 @@ class Team:
             :param prompt: Prompt to generate output for
             :return: str
             """
-        # gather initial responses
-        responses: list[str] = list()
-        promises = list()
-        print('[bold cyan] Generate initial responses for prompt [/]')
-        for i, agent in enumerate(self.agents):
-            promises.append(agent.run(prompt=prompt))
-            print(f'> {i + 1}/{len(self.agents)}')
-        for result in asyncio.gather(promises):
-            responses.append(result.content)
-
-        # gather feedbacks
-        print(f'[bold cyan] Generate initial feedback for responses [/]')
-        response_feedbacks: list[list[dict]] = await self.__supervisor_judge(prompt, responses)
-
-        # iterate over and over until we get a correct response
+        if self.race:
+            # generate and judge initial responses, first approved response wins
+            print(f'[bold cyan] Racing initial responses for prompt ({len(self.agents)} agents) [/]')
+            streaming.emit('generating', agents=len(self.agents))
+            streaming.emit('judging', responses=len(self.agents))
+            responses: list[str | None] = [None] * len(self.agents)
+            response_feedbacks: list[list[dict]] = [[] for _ in self.agents]
+            with tracing.span('team.race'):
+                winner = await self.__race(prompt, responses, response_feedbacks, list(range(len(self.agents))))
+            if winner is not None:
+                return winner
+        else:
+            # gather initial responses
+            print(f'[bold cyan] Generate initial responses for prompt ({len(self.agents)} agents) [/]')
+            streaming.emit('generating', agents=len(self.agents))
+            with tracing.span('team.generate'):
+                results = await executor.gather(streaming.draft(agent.run(prompt=prompt), i)
+                                                for i, agent in enumerate(self.agents))
+            responses: list[str | None] = [result.content if result else None for result in results]
+
+            # gather feedbacks
+            print(f'[bold cyan] Generate initial feedback for responses [/]')
+            streaming.emit('judging', responses=len(responses))
+            with tracing.span('team.judge'):
+                response_feedbacks: list[list[dict]] = await self.__supervisor_judge(prompt, responses,
+                                                                                     list(range(len(responses))))
+
+        # iterate until we get a correct response, approved responses and their feedbacks are kept,
+        # only rejected responses are regenerated and judged again
         print(f'[bold cyan]Iterating over responses using supervisors if needed[/]')
         max_iter = 6
         i = 0
-        while i < max_iter and not (correct_responses := await Team.__check_response_feedbacks(responses, response_feedbacks)):
+        while i < max_iter and not (approved := self.__check_response_feedbacks(response_feedbacks)):
             print(f'Current Iteration: {i}')
             i += 1
-            responses = await self.__supervised_run_all(prompt, response_feedbacks)
-            if i < max_iter:
-                response_feedbacks = await self.__supervisor_judge(prompt, responses)
+            rejected = [j for j, feedbacks in enumerate(response_feedbacks) if not self.__approved(feedbacks)]
+            streaming.emit('iteration', n=i, rejected=len(rejected))
+            if i < max_iter and self.batch_judge:
+                # regenerate the rejected responses and judge them together
+                with tracing.span('team.supervised_rerun', iteration=i, rejected=len(rejected)):
+                    reruns = await self.__supervised_run_all(prompt, response_feedbacks, rejected)
+                for j, response in zip(rejected, reruns):
+                    responses[j] = response
+                with tracing.span('team.judge', iteration=i):
+                    for j, feedbacks in zip(rejected, await self.__supervisor_judge(prompt, responses, rejected)):
+                        response_feedbacks[j] = feedbacks
+            elif i < max_iter:
+                # stop as soon as one of the regenerated responses is approved
+                with tracing.span('team.supervised_rerun', iteration=i, rejected=len(rejected)):
+                    winner = await self.__race(prompt, responses, response_feedbacks, rejected, retry=True)
+                if winner is not None:
+                    return winner
             else:
-                correct_responses = responses
+                with tracing.span('team.supervised_rerun', iteration=i, rejected=len(rejected)):
+                    reruns = await self.__supervised_run_all(prompt, response_feedbacks, rejected)
+                for j, response in zip(rejected, reruns):
+                    # the last responses are not judged anymore
+                    responses[j], response_feedbacks[j] = response, []
+                approved = [j for j, response in enumerate(responses) if response is not None]
+        if not approved:
+            raise RuntimeError('No agent produced a response')
         print(f'[bold green]Correct responses have been generated[/]')
 
-        # if there is more than one agreed upon response, let the supervisors vote
-        if len(correct_responses) > 1:
-            print(f'[bold cyan]Supervisors voting on best response[/]')
-            return await self.__supervisor_vote(prompt, correct_responses)
+        # if there is more than one agreed upon response, select the best one
+        if len(approved) > 1:
+            return await self.__select(prompt, responses, response_feedbacks, approved)
 
-        return correct_responses[0]
+        return responses[approved[0]]
+
+    def __schedule_compaction(self) -> None:
+        """
+        Fold the turns before the latest verbatim turns into the summary in the background
+
+        :return: None
+        """
+        # history entries are (role, message) pairs, two per turn
+        # wait until another verbatim_turns turns have piled up, so it's not one summary call per turn
+        if self in _compacting or len(self.history) - self.summarized <= 4 * self.verbatim_turns:
+            return
+        _compacting.add(self)
+        task = asyncio.create_task(self.__compact())
+        _background.add(task)
+        task.add_done_callback(_background.discard)
+
+    async def __compact(self) -> None:
+        """
+        Fold older turns into the summary and hand it to the agents
+
+        :return: None
+        """
+        # runs in its own task, so this doesn't affect the request that scheduled it
+        scheduler.priority.set(scheduler.BACKGROUND)
+        try:
+            end = len(self.history) - 2 * self.verbatim_turns
+            turns = '\n'.join(f'{role}: {message}' for role, message in self.history[self.summarized:end])
+            with tracing.span('team.compact', turns=end - self.summarized):
+                summary = await executor.call(summarizer().run(summary=self.summary, turns=turns))
+            if not summary:
+                return
+            self.summary = summary
+            self.summarized = end
+            # the agents get the summary with the next run, see __trim
+            print(f'[bold cyan]Compacted chat history up to turn {end}[/]')
+            if self.on_compacted:
+                self.on_compacted()
+        finally:
+            _compacting.discard(self)
+
+    def __trim(self) -> None:
+        """
+        Hand a new summary to the agents and drop the turns it covers from their memories,
+        so their prompts hold the summary and only the turns after it (like a team restored from the log).
+        Done before a run, not by the compaction itself, which may finish in the middle of a run.
+
+        :return: None
+        """
+        if self.trimmed == self.summarized:
+            return
+        for agent in self.agents:
+            agent.clear()
+            agent.summary = self.summary
+            agent.set_history(self._history[self.summarized:])
+        self.trimmed = self.summarized
+
+    @property
+    def busy(self) -> bool:
+        """
+        Whether the team is still compacting its history in the background
+
+        :return: True if busy
+        """
+        return self in _compacting
+
+    def restore(self, history: list[tuple[str, str]], summary: str = '', summarized: int = 0) -> None:
+        """
+        Restore a conversation, e.g. from the message log of a session
+
+        :param history: chat history
+        :param summary: summary of the history up to summarized
+        :param summarized: number of history entries covered by the summary
+        :return: None
+        """
+        self._history = list(history)
+        self.summary = summary
+        self.summarized = summarized
+        self.trimmed = summarized
+        for agent in self.agents:
+            agent.clear()
+            agent.summary = summary
+            agent.set_history(self._history[summarized:])
+
+    def reset(self) -> None:
+        """
+        Forget the conversation (history, summary and the memories of all roles), keep the roles
+
+        :return: None
+        """
+        self._history = list()
+        self.summary = ''
+        self.summarized = 0
+        self.trimmed = 0
+        for agent in self.agents:
+            agent.clear()
 
     async def __call__(self, prompt) -> str:
+        self.__trim()
         self.history.append(('User', prompt))
-        response = await self.__run(prompt)
+        with tracing.span('team.run', agents=len(self.agents), supervisors=len(self.supervisors),
+                          race=self.race, batch_judge=self.batch_judge, policy=self.policy):
+            response = await self.__run(prompt)
         self.history.append(('Bot', response))
+        self.__schedule_compaction()
         return response
 
     def __repr__(self):
@@ -0,0 +1,205 @@
+"""
+Content addressed cache for LLM responses.
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Awaitable, Callable
+
+import sqlalchemy as sql
+from sqlalchemy import Table, Column, String, Text, Float, MetaData
+
+from settings import settings
+from persistence import database
+
+# who is asking, part of the cache key: roles sharing an action (e.g. the supervisors of a team) must not share
+# their responses, each of them is an independent sample of the model
+scope: ContextVar[str] = ContextVar('cache_scope', default='')
+
+
+class ResponseCache:
+    """
+    In-memory LRU cache with TTL and an optional on-disk SQLite tier
+    """
+
+    def __init__(self, size: int = 1024, ttl: float = 3600, path: str | Path | None = None):
+        """
+        Constructor for ResponseCache class
+
+        :param size: maximum number of responses kept in memory
+        :param ttl: time to live of a response in seconds
+        :param path: path of the SQLite database for the on-disk tier, None to disable it
+        """
+        self.size = size
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        # calls in flight: key -> [task, number of waiters]
+        self._inflight: dict[str, list] = dict()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+        self._engine = None
+        self._table = None
+        if path:
+            self._engine = sql.create_engine(f'sqlite:///{path}')
+            metadata = MetaData()
+            self._table = Table(
+                "responses", metadata,
+                Column("key", String, primary_key=True),
+                Column("response", Text),
+                Column("created", Float),
+            )
+            metadata.create_all(bind=self._engine)
+
+    @staticmethod
+    def key(model: str, prompt: str, role: str, scope: str = '') -> str:
+        """
+        Build the cache key for a request
+
+        :param model: name of the model
+        :param prompt: prompt sent to the model
+        :param role: role (system message) the prompt is sent with
+        :param scope: who is asking (see scope), responses are only shared within a scope
+        :return: cache key
+        """
+        return hashlib.sha256(json.dumps([model, role, prompt, scope]).encode()).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        """
+        Look up a response in memory
+
+        :param key: cache key
+        :return: the cached response or None if not found / expired
+        """
+        entry = self._entries.get(key)
+        if entry and time.time() - entry[0] < self.ttl:
+            self._entries.move_to_end(key)
+            return entry[1]
+        if entry:
+            del self._entries[key]
+        return None
+
+    def put(self, key: str, response: str, created: float | None = None) -> None:
+        """
+        Store a response in memory
+
+        :param key: cache key
+        :param response: response of the model
+        :param created: time the response was created, defaults to now
+        :return: None
+        """
+        self.__remember(key, created or time.time(), response)
+
+    def __read(self, key: str) -> tuple[float, str] | None:
+        # blocking, runs on the database thread pool
+        with self._engine.connect() as conn:
+            row = conn.execute(
+                sql.select(self._table.c.created, self._table.c.response).where(self._table.c.key == key)
+            ).first()
+        return (row[0], row[1]) if row and time.time() - row[0] < self.ttl else None
+
+    def __write(self, key: str, created: float, response: str) -> None:
+        # blocking, runs on the database thread pool
+        with self._engine.connect() as conn:
+            conn.execute(sql.delete(self._table).where(self._table.c.key == key))
+            conn.execute(self._table.insert().values(key=key, response=response, created=created))
+            conn.commit()
+
+    async def __miss(self, key: str, call: Callable[[], Awaitable[str]]) -> str:
+        """
+        Look up a response missing in memory on disk, on a miss there too run call and store its result
+
+        :param key: cache key
+        :param call: function creating the model call
+        :return: the response
+        """
+        if self._engine is not None and (row := await database.run(self.__read, key)) is not None:
+            self.hits += 1
+            self.put(key, row[1], row[0])
+            return row[1]
+
+        self.misses += 1
+        response = await call()
+        created = time.time()
+        self.put(key, response, created)
+        if self._engine is not None:
+            await database.run(self.__write, key, created, response)
+        return response
+
+    async def fetch(self, key: str, call: Callable[[], Awaitable[str]]) -> str:
+        """
+        Look up a response, on a miss run call and store its result.
+        Concurrent misses for the same key share a single call.
+
+        :param key: cache key
+        :param call: function creating the model call
+        :return: the response
+        """
+        if (rsp := self.get(key)) is not None:
+            self.hits += 1
+            return rsp
+
+        entry = self._inflight.get(key)
+        if entry is None:
+            task = asyncio.ensure_future(self.__miss(key, call))
+            entry = self._inflight[key] = [task, 0]
+            task.add_done_callback(lambda done: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+
+        entry[1] += 1
+        try:
+            return await asyncio.shield(entry[0])
+        except asyncio.CancelledError:
+            # only cancel the call once nobody is waiting for it anymore
+            entry[1] -= 1
+            if entry[1] == 0:
+                entry[0].cancel()
+            raise
+
+    def __remember(self, key: str, created: float, response: str) -> None:
+        self._entries[key] = (created, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """
+        Drop all cached responses (both tiers) and reset the counters
+
+        :return: None
+        """
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        if self._engine is not None:
+            with self._engine.connect() as conn:
+                conn.execute(sql.delete(self._table))
+                conn.commit()
+
+    def stats(self) -> dict:
+        """
+        Hit/miss counters of the cache
+
+        :return: stats
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "disk": self._engine is not None,
+        }
+
+
+# shared by all actions which opt in to caching
+responses = ResponseCache(**settings['cache'])
@@ -0,0 +1,96 @@
+"""
+Clustering of near-duplicate answers, so supervisors judge and vote on every distinct answer only once.
+
+Answers with the same normalized text are duplicates; other answers are compared by the Jaccard similarity
+of their word shingles, estimated with MinHash signatures.
+"""
+
+import hashlib
+import random
+import re
+import zlib
+
+from settings import settings
+
+# modulus of the MinHash permutations (Mersenne prime, larger than any crc32)
+_PRIME = (1 << 61) - 1
+_rng = random.Random(0)
+_permutations = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME))
+                 for _ in range(settings['dedup']['permutations'])]
+
+
+def normalize(text: str) -> str:
+    """
+    Normalize a text for comparison: lower case, no punctuation, single spaces
+
+    :param text: text
+    :return: normalized text
+    """
+    return ' '.join(re.sub(r'[^\w\s]', ' ', text.lower()).split())
+
+
+def fingerprint(text: str) -> str:
+    """
+    Hash of the normalized text
+
+    :param text: text
+    :return: hash
+    """
+    return hashlib.sha256(normalize(text).encode()).hexdigest()
+
+
+def signature(text: str, shingle: int = settings['dedup']['shingle']) -> list[int]:
+    """
+    MinHash signature of the word shingles of a text
+
+    :param text: text
+    :param shingle: number of words per shingle
+    :return: signature
+    """
+    words = normalize(text).split()
+    shingles = {zlib.crc32(' '.join(words[i:i + shingle]).encode())
+                for i in range(max(len(words) - shingle + 1, 1))}
+    return [min((a * s + b) % _PRIME for s in shingles) for a, b in _permutations]
+
+
+def similarity(a: list[int], b: list[int]) -> float:
+    """
+    Estimated Jaccard similarity of two texts from their signatures
+
+    :param a: signature of the first text
+    :param b: signature of the second text
+    :return: similarity in [0, 1]
+    """
+    return sum(1 for x, y in zip(a, b) if x == y) / len(a)
+
+
+def cluster(texts: list[str | None], threshold: float = settings['dedup']['threshold']) -> list[list[int]]:
+    """
+    Group near-duplicate texts, None entries are left out
+
+    :param texts: texts
+    :param threshold: minimum estimated similarity to the first text of a cluster to join it
+    :return: clusters of indices into texts, the first index of a cluster is its representative
+    """
+    clusters: list[list[int]] = list()
+    by_fingerprint: dict[str, list[int]] = dict()
+    signatures: list[list[int]] = list()
+    for i, text in enumerate(texts):
+        if text is None:
+            continue
+        key = fingerprint(text)
+        if key in by_fingerprint:
+            by_fingerprint[key].append(i)
+            continue
+
+        sig = signature(text)
+        for members, rep in zip(clusters, signatures):
+            if similarity(sig, rep) >= threshold:
+                members.append(i)
+                by_fingerprint[key] = members
+                break
+        else:
+            clusters.append([i])
+            signatures.append(sig)
+            by_fingerprint[key] = clusters[-1]
+    return clusters
@@ -0,0 +1,57 @@
+"""
+Concurrent fan-out of LLM calls for the team phases.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Iterable
+
+from rich import print
+
+from settings import settings
+
+
+class FanOut:
+    """
+    Runs calls concurrently with a deadline per call and failure isolation
+    (a failing call yields a fallback value instead of failing the others).
+    The number of LLM calls in flight is capped by the scheduler of each backend, the timeout of a single
+    model call (settings executor.timeout) starts once the scheduler granted its slot.
+    """
+
+    def __init__(self, timeout: float | None = 120):
+        """
+        Constructor for FanOut class
+
+        :param timeout: deadline per call in seconds including the wait for scheduler slots, None to disable
+        """
+        self.timeout = timeout
+
+    async def call(self, call: Awaitable, fallback: Any = None) -> Any:
+        """
+        Await a single call
+
+        :param call: awaitable to run
+        :param fallback: value returned if the call fails or times out
+        :return: result of the call or the fallback
+        """
+        try:
+            return await asyncio.wait_for(call, self.timeout)
+        except asyncio.TimeoutError:
+            print(f'[bold red]call timed out[/]')
+        except Exception as e:
+            print(f'[bold red]call failed: {e!r}[/]')
+        return fallback
+
+    async def gather(self, calls: Iterable[Awaitable], fallback: Any = None) -> list:
+        """
+        Await all calls concurrently, results are in the same order as the calls
+
+        :param calls: awaitables to run
+        :param fallback: value used for every call that fails or times out
+        :return: list of results
+        """
+        return list(await asyncio.gather(*(self.call(call, fallback) for call in calls)))
+
+
+# shared by all teams in this process
+executor = FanOut(timeout=settings['executor']['deadline'])
@@ -1,21 +1,22 @@
 import re
-import asyncio
-import typing
 
 from metagpt.actions import Action
-from metagpt.roles import Role
-from metagpt.schema import Message
-from metagpt.logs import logger
 
-from templates import BaseDynamicAction, BaseRole, ChatRole
+from agents.templates import BaseDynamicAction, BaseAgent, PromptTemplate
+from agents.agents import ChatRole
 
 
-def generate_action(name: str, prompt_template: str, output_pattern: str = '.*', classname=None,
+def generate_action(name: str, prompt_template: str, output_pattern: str | None = '.*', classname=None,
                     template: type(Action) = None) -> type(Action):
     """
-    Generate a metagpt action class from the given arguments
-
-    :param kwargs: Attributes of action class object
+    Generate a metagpt action class from the given arguments.
+    The prompt template and the output pattern are compiled once, here, not for every response.
+
+    :param name: Name of the action
+    :param prompt_template: Prompt template with named fields, e.g. '{prompt}'
+    :param output_pattern: Regex the response is cut down to (first match), None for the whole response
+    :param classname: Name of the class, defaults to name
+    :param template: Template for the action class (superclass), defaults to BaseDynamicAction
     :return: metagpt action class object
     """
 
@@ -23,66 +24,47 @@ def generate_action(name: str, prompt_template: str, output_pattern: str = '.*',
     classname = classname or name
     template = template or BaseDynamicAction
 
-    def match_pattern(rsp):
-        pattern = re.compile(output_pattern, re.DOTALL)
-        match = re.search(pattern, rsp)
-        result = match.group(0) if match else rsp
-        return result
-
     action = type(
         classname,
         (template,),
         {
-            'match_pattern': staticmethod(match_pattern),
+            '__module__': __name__,
+            '__annotations__': {'name': str},
+            'name': name,
+            'prompt_template': PromptTemplate(prompt_template),
+            'output_pattern': re.compile(output_pattern, re.DOTALL) if output_pattern else None,
         },
     )
 
-    attributes = {
-        'name': name,
-        'prompt_template': prompt_template,
-    }
-
-    for attribute in attributes:
-        setattr(action, attribute, attributes[attribute])
-
     return action
 
 
 def generate_role(name: str, actions: list[type(Action)], profile: str = None, classname=None,
-                  template: type(Action) = None) -> type(Role):
+                  template: type(BaseAgent) = None) -> type(BaseAgent):
     """
-    Generate a metagpt role class from the given arguments
+    Generate an agent class from the given arguments
 
-    :param name: Name of the agent
+    :param name: Name of the agent type, used as profile if none is given
     :param actions: List of actions for the agent
-    :param profile: Profile of the agent, defaults to role name
+    :param profile: Profile of the agent, defaults to name
     :param classname: Name of the class, defaults to 'AgentRole'
-    :param template: Template for the role class (superclass), defaults to Role
-    :return:
+    :param template: Template for the agent class (superclass), defaults to ChatRole
+    :return: agent class
     """
 
     classname = classname or 'AgentRole'
-    profile = profile or classname
-    template = template or BaseDynamicRole
-
-    def __init__(self, **kwargs):
-        template.__init__(self, **kwargs)
-        self.set_actions(actions)
+    profile = profile or name or classname
+    template = template or ChatRole
 
     role = type(
         classname,
         (template,),
         {
-            '__init__': __init__,
+            '__module__': __name__,
+            '__slots__': (),
+            'profile': profile,
+            'action_types': tuple(actions),
         },
     )
 
-    attributes = {
-        'name': name,
-        'profile': profile,
-    }
-
-    for attribute in attributes:
-        setattr(role, attribute, attributes[attribute])
-
     return role
@@ -0,0 +1,69 @@
+"""
+Bounded memory of the chat agents.
+"""
+
+import json
+import zlib
+from collections import deque
+from typing import Iterable, Iterator
+
+from settings import settings
+
+
+class Memory:
+    """
+    Latest turns of the conversation of an agent. Once the capacity is reached the oldest turn is dropped,
+    the team keeps the dropped turns in its summary of the conversation.
+    """
+    __slots__ = ('_turns',)
+
+    def __init__(self, turns: Iterable[str] = (), capacity: int | None = settings['memory']['capacity']):
+        """
+        Constructor for Memory class
+
+        :param turns: initial turns, oldest first
+        :param capacity: maximum number of turns, None for no limit
+        """
+        self._turns: deque[str] = deque(turns, maxlen=capacity)
+
+    @property
+    def capacity(self) -> int | None:
+        return self._turns.maxlen
+
+    def append(self, turn: str) -> None:
+        """
+        Add a turn, drops the oldest turn if the memory is full
+
+        :param turn: turn
+        :return: None
+        """
+        self._turns.append(turn)
+
+    def last(self, k: int = 0) -> list[str]:
+        """
+        Latest turns
+
+        :param k: number of turns, 0 for all
+        :return: turns, oldest first
+        """
+        if not k or k >= len(self._turns):
+            return list(self._turns)
+        # indexing close to the end of a deque is O(1)
+        return [self._turns[-i] for i in range(k, 0, -1)]
+
+    def clear(self) -> None:
+        self._turns.clear()
+
+    def __len__(self) -> int:
+        return len(self._turns)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._turns)
+
+    def __getstate__(self) -> tuple[int | None, bytes]:
+        # the turns repeat a lot of text (prompt markup, quoted answers), compressed they are a fraction of the size
+        return self.capacity, zlib.compress(json.dumps(list(self._turns)).encode())
+
+    def __setstate__(self, state: tuple[int | None, bytes]) -> None:
+        capacity, turns = state
+        self._turns = deque(json.loads(zlib.decompress(turns)), maxlen=capacity)
@@ -0,0 +1,156 @@
+"""
+Deterministic offline stand-in for the LLM, used to benchmark the orchestration without a model server.
+"""
+
+import asyncio
+import json
+import math
+import random
+import re
+from collections import Counter
+from itertools import cycle
+
+from metagpt.logs import log_llm_stream
+
+from agents import templates
+from settings import settings
+
+
+class MockLLM:
+    """
+    Fake LLM with configurable latency, token rate and scripted supervisor verdicts.
+    Responses depend on the action that asks, e.g. SuperviseAction gets a JSON verdict.
+    """
+    name: str = 'mock'
+
+    def __init__(self, latency: str = 'lognormal', latency_mean: float = 0.5, latency_spread: float = 0.5,
+                 tokens_per_second: float | None = 50, answer_tokens: int = 60, approve: float = 0.7,
+                 verdicts: list[bool] | None = None, messy: float = 0.0, seed: int | None = 0):
+        """
+        Constructor for MockLLM class
+
+        :param latency: latency distribution until the first token: constant, uniform, exponential or lognormal
+        :param latency_mean: mean latency in seconds
+        :param latency_spread: spread of the latency (uniform: +/- fraction of the mean, lognormal: sigma)
+        :param tokens_per_second: rate at which answer tokens are streamed, None to return them at once
+        :param answer_tokens: number of tokens of a chat answer
+        :param approve: probability that a supervisor approves an answer
+        :param verdicts: scripted verdicts (cycled), overrides approve
+        :param messy: probability that JSON output is wrapped in prose and a code fence,
+                      like models do unless their output is constrained to JSON
+        :param seed: seed for the random generator, None for a random seed
+        """
+        self.latency = latency
+        self.latency_mean = latency_mean
+        self.latency_spread = latency_spread
+        self.tokens_per_second = tokens_per_second
+        self.answer_tokens = answer_tokens
+        self.approve = approve
+        self._verdicts = cycle(verdicts) if verdicts else None
+        self.messy = messy
+        self._rng = random.Random(seed)
+        # calls by action name
+        self.calls: Counter = Counter()
+
+    def delay(self) -> float:
+        """
+        Draw a latency from the configured distribution
+
+        :return: latency in seconds
+        """
+        if self.latency == 'constant':
+            return self.latency_mean
+        if self.latency == 'uniform':
+            return self._rng.uniform(self.latency_mean * (1 - self.latency_spread),
+                                     self.latency_mean * (1 + self.latency_spread))
+        if self.latency == 'exponential':
+            return self._rng.expovariate(1 / self.latency_mean)
+        if self.latency == 'lognormal':
+            # mean of the lognormal distribution is exp(mu + sigma^2 / 2)
+            sigma = self.latency_spread
+            mu = math.log(self.latency_mean) - sigma ** 2 / 2
+            return self._rng.lognormvariate(mu, sigma)
+        raise ValueError(f'Unknown latency distribution \'{self.latency}\'')
+
+    def verdict(self) -> bool:
+        """
+        Next scripted (or random) supervisor verdict
+
+        :return: True if approved
+        """
+        if self._verdicts is not None:
+            return next(self._verdicts)
+        return self._rng.random() < self.approve
+
+    def score(self, correct: bool) -> int:
+        """
+        Random quality score matching a verdict
+
+        :param correct: verdict
+        :return: score from 0 to 10
+        """
+        return self._rng.randint(6, 10) if correct else self._rng.randint(0, 5)
+
+    def json(self, value, action=None) -> str:
+        """
+        JSON output, messy unless the action's output is constrained to JSON
+
+        :param value: JSON value
+        :param action: action asking
+        :return: output
+        """
+        output = json.dumps(value)
+        constrained = getattr(action, 'json_output', False) and settings['parsing']['constrained']
+        if constrained or self._rng.random() >= self.messy:
+            return output
+        return f"Sure, here is my verdict:\n```json\n{output.replace('true', 'True').replace('false', 'False')}\n```"
+
+    async def aask(self, prompt: str, system_msgs: list[str] | None = None, action=None) -> str:
+        """
+        Answer a prompt like the model would for the asking action
+
+        :param prompt: prompt
+        :param system_msgs: system messages (ignored)
+        :param action: action asking
+        :return: response
+        """
+        name = type(action).__name__
+        self.calls[name] += 1
+        await asyncio.sleep(self.delay())
+
+        if name == 'SuperviseAction':
+            correct = self.verdict()
+            return self.json({"correct": correct, "score": self.score(correct),
+                              "reason": "" if correct else "The answer is too vague."}, action)
+        if name == 'SuperviseBatchAction':
+            answers = len(re.findall(r'##ANSWER \d+:', prompt))
+            return self.json([
+                {"index": i, "correct": (correct := self.verdict()), "score": self.score(correct),
+                 "reason": "" if correct else "Too vague."}
+                for i in range(answers)
+            ], action)
+        if name == 'SuperviseVoteAction':
+            answers = len(re.findall(r'ANSWER \d+:', prompt))
+            return self.json({"chosen": self._rng.randrange(max(answers, 1))}, action)
+        if name == 'SummarizeAction':
+            return f'The user and the bot talked about {self.calls[name]} things.'
+
+        # chat answer, streamed token by token
+        words = [f'word{self._rng.randrange(1000)}' for _ in range(self.answer_tokens)]
+        if self.tokens_per_second:
+            for word in words:
+                log_llm_stream(word + ' ')
+                await asyncio.sleep(1 / self.tokens_per_second)
+        return ' '.join(words)
+
+
+def install(llm: MockLLM | None = None) -> MockLLM:
+    """
+    Route all LLM calls to a mock LLM
+
+    :param llm: mock LLM, defaults to MockLLM()
+    :return: the installed mock LLM
+    """
+    llm = llm or MockLLM()
+    templates.set_provider(llm)
+    return llm
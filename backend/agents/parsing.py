@@ -0,0 +1,187 @@
+"""
+Tolerant parsing of structured (JSON) model output.
+
+Models like to wrap their JSON in prose or code fences, use Python literals, single quotes or trailing commas
+and sometimes stop in the middle of it. values() finds the JSON values in the output and repairs
+these defects, validate() checks one against a schema (any type pydantic can validate)
+and parse() returns the first one that is valid.
+"""
+
+import json
+import re
+from functools import lru_cache
+from typing import Any, Iterator
+
+from pydantic import TypeAdapter, ValidationError
+
+# number of JSON candidates tried before giving up
+MAX_CANDIDATES = 8
+
+_SMART_QUOTES = str.maketrans({'“': '"', '”': '"', '‘': "'", '’': "'"})
+_LITERALS = {'True': 'true', 'False': 'false', 'None': 'null'}
+_WORD = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+_SPACE = re.compile(r'\s*')
+_TRAILING_COMMA = re.compile(r',\s*([}\]])')
+
+
+class ParseError(ValueError):
+    """
+    The output contains no (valid) JSON
+    """
+
+
+def _closing(text: str, start: int) -> str:
+    """
+    The JSON value starting at start: up to its matching bracket, closed if the text ends before
+
+    :param text: text
+    :param start: index of the opening bracket
+    :return: JSON value
+    """
+    stack: list[str] = list()
+    quote: str | None = None
+    escaped = False
+    for i in range(start, len(text)):
+        c = text[i]
+        if quote:
+            if escaped:
+                escaped = False
+            elif c == '\\':
+                escaped = True
+            elif c == quote:
+                quote = None
+        elif c in '"\'':
+            quote = c
+        elif c in '{[':
+            stack.append('}' if c == '{' else ']')
+        elif c in '}]':
+            if not stack or stack.pop() != c:
+                break
+            if not stack:
+                return text[start:i + 1]
+    # the output stopped in the middle of the value
+    return text[start:] + (quote or '') + ''.join(reversed(stack))
+
+
+def _candidates(text: str) -> Iterator[str]:
+    """
+    JSON values in text, in order of appearance
+
+    :param text: text
+    :return: iterator over the candidates
+    """
+    starts = [m.start() for m in re.finditer(r'[{\[]', text)][:MAX_CANDIDATES]
+    for start in starts:
+        yield _closing(text, start)
+
+
+def repair(text: str) -> str:
+    """
+    Fix common defects of JSON written by models: Python literals, single quoted strings,
+    unquoted keys, smart quotes and trailing commas
+
+    :param text: almost JSON
+    :return: hopefully JSON
+    """
+    text = text.translate(_SMART_QUOTES)
+    out: list[str] = list()
+    i = 0
+    while i < len(text):
+        c = text[i]
+        if c in '"\'':
+            # copy the string, converted to a double quoted one
+            j = i + 1
+            body: list[str] = list()
+            while j < len(text) and text[j] != c:
+                if text[j] == '\\' and j + 1 < len(text):
+                    body.append(text[j:j + 2])
+                    j += 2
+                    continue
+                body.append('\\"' if text[j] == '"' else text[j])
+                j += 1
+            out.append('"' + ''.join(body).replace("\\'", "'") + '"')
+            i = j + 1
+            continue
+
+        word = _WORD.match(text, i)
+        if word and (i == 0 or not text[i - 1].isalnum()):
+            value = word.group()
+            is_key = text[_SPACE.match(text, word.end()).end():].startswith(':')
+            out.append(f'"{value}"' if is_key else _LITERALS.get(value, value))
+            i = word.end()
+            continue
+
+        out.append(c)
+        i += 1
+    return _TRAILING_COMMA.sub(r'\1', ''.join(out))
+
+
+def values(text: str) -> Iterator[Any]:
+    """
+    JSON values (objects or arrays) in the output of a model, in order of appearance
+
+    :param text: output of the model
+    :return: iterator over the JSON values
+    """
+    try:
+        yield json.loads(text, strict=False)
+        return
+    except json.JSONDecodeError:
+        pass
+
+    for candidate in _candidates(text):
+        for fix in (str, repair):
+            try:
+                yield json.loads(fix(candidate), strict=False)
+                break
+            except json.JSONDecodeError:
+                continue
+
+
+def extract(text: str) -> Any:
+    """
+    First JSON value (object or array) in the output of a model
+
+    :param text: output of the model
+    :return: JSON value
+    """
+    for value in values(text):
+        return value
+    raise ParseError(f'No JSON found in {text[:80]!r}')
+
+
+@lru_cache(maxsize=None)
+def _adapter(schema: Any) -> TypeAdapter:
+    return TypeAdapter(schema)
+
+
+def validate(value: Any, schema: Any) -> Any:
+    """
+    Validate (and coerce) a JSON value against a schema
+
+    :param value: JSON value
+    :param schema: pydantic model or type, e.g. list[Model]
+    :return: validated value
+    """
+    try:
+        return _adapter(schema).validate_python(value)
+    except ValidationError as e:
+        raise ParseError(str(e)) from e
+
+
+def parse(text: str, schema: Any) -> Any:
+    """
+    First JSON value in the output of a model that is valid against a schema.
+    Values before it, e.g. from bracketed prose like "see [1]", are skipped.
+
+    :param text: output of the model
+    :param schema: pydantic model or type, e.g. list[Model]
+    :return: validated value
+    """
+    error: ParseError | None = None
+    for value in values(text):
+        try:
+            return validate(value, schema)
+        except ParseError as e:
+            error = error or e
+    raise error or ParseError(f'No JSON found in {text[:80]!r}')
@@ -0,0 +1,199 @@
+"""
+Declarative team pipelines: the agents of a team (prompt templates and output patterns of their actions)
+and its supervision settings, described in a YAML or JSON file in backend/pipelines.
+
+A pipeline is compiled once into agent and action classes with parsed templates and compiled regexes,
+cached by the hash of its spec, and selected per configuration by its name.
+"""
+
+import hashlib
+import json
+from pathlib import Path
+from typing import ClassVar
+
+import yaml
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+
+from agents.agents import Team, ChatRole, ChatAction, SupervisorRole
+from agents.generation import generate_action, generate_role
+
+PIPELINES_DIR = Path(__file__).parent.parent / 'pipelines'
+SUFFIXES = ('.yaml', '.yml', '.json')
+
+
+class ActionSpec(BaseModel):
+    model_config = ConfigDict(extra='forbid')
+
+    name: str = 'Chat'
+    # fields: {prompt} (the prompt of the user) and {context} (the chat history)
+    prompt: str = ChatAction.prompt_template.template
+    # regex the answer is cut down to (first match), None for the whole answer
+    pattern: str | None = None
+
+
+class RoleSpec(BaseModel):
+    model_config = ConfigDict(extra='forbid')
+
+    profile: str = 'ChatRole'
+    action: ActionSpec = Field(default_factory=ActionSpec)
+
+
+class PipelineSpec(BaseModel):
+    model_config = ConfigDict(extra='forbid')
+
+    description: str = ''
+    # agent types, the agents of a team are assigned to them in turn
+    agents: list[RoleSpec] = Field(default_factory=list)
+    # team options, None for the defaults (see Team)
+    race: bool | None = None
+    batch_judge: bool | None = None
+    policy: str | None = None
+    quorum: int | None = None
+    dedup: bool | None = None
+    selection: str | None = None
+    tie_margin: float | None = None
+    history_budget: int | None = None
+    verbatim_turns: int | None = None
+
+
+TEAM_OPTIONS = ('race', 'batch_judge', 'policy', 'quorum', 'dedup', 'selection', 'tie_margin', 'history_budget',
+                'verbatim_turns')
+
+
+class PipelineAgent(ChatRole):
+    """
+    Base class of the agents of a pipeline. The classes are generated at runtime,
+    so agents are pickled as a reference to their pipeline.
+    """
+    __slots__ = ()
+    pipeline: ClassVar[str] = ''
+    role_index: ClassVar[int] = 0
+
+    def __reduce__(self):
+        return _agent, (self.pipeline, self.role_index), self.__getstate__()
+
+
+def _agent(name: str, index: int) -> PipelineAgent:
+    """
+    Empty agent of a pipeline, used for unpickling
+
+    :param name: name of the pipeline
+    :param index: index of the agent type in the pipeline
+    :return: agent (state not set)
+    """
+    cls = load(name).roles[index]
+    return cls.__new__(cls)
+
+
+class Pipeline:
+    """
+    A compiled pipeline
+    """
+
+    def __init__(self, name: str, spec: PipelineSpec, key: str):
+        """
+        Constructor for Pipeline class, use load or build instead
+
+        :param name: name of the pipeline
+        :param spec: validated spec
+        :param key: hash of the spec
+        """
+        self.name = name
+        self.spec = spec
+        self.key = key
+        self.roles: list[type[ChatRole]] = list()
+        for i, role in enumerate(spec.agents):
+            action = generate_action(role.action.name, role.action.prompt, role.action.pattern,
+                                     classname=f'{role.action.name}Action', template=ChatAction)
+            fields = action.prompt_template.fields
+            if 'prompt' not in fields or not fields <= {'prompt', 'context'}:
+                raise ValueError(f'Prompt template of agent {i} must contain {{prompt}} and may contain {{context}}')
+            agent = generate_role(role.profile, [action], classname=role.profile, template=PipelineAgent)
+            agent.pipeline, agent.role_index = name, i
+            self.roles.append(agent)
+        self.options = {option: getattr(spec, option) for option in TEAM_OPTIONS
+                        if getattr(spec, option) is not None}
+        # fail early on invalid options (e.g. an unknown policy)
+        Team(agents=[], supervisors=[], **self.options)
+
+    def team(self, agents: int, supervisors: int) -> Team:
+        """
+        Build a team of this pipeline
+
+        :param agents: number of agents
+        :param supervisors: number of supervisors
+        :return: team
+        """
+        roles = self.roles or [ChatRole]
+        return Team(agents=[roles[i % len(roles)]() for i in range(agents)],
+                    supervisors=[SupervisorRole() for _ in range(supervisors)], **self.options)
+
+    def __repr__(self):
+        return f'<Pipeline: {self.name}, agents={len(self.roles)}, options={self.options}>'
+
+
+# compiled pipelines by hash of name and spec
+compiled: dict[str, Pipeline] = dict()
+# name -> (modification time, hash) of the pipeline files read so far
+_files: dict[str, tuple[float, str]] = dict()
+
+
+def build(name: str, spec: dict) -> Pipeline:
+    """
+    Compile a pipeline spec, unless the same spec has been compiled before
+
+    :param name: name of the pipeline
+    :param spec: spec (parsed YAML/JSON)
+    :return: pipeline
+    """
+    key = hashlib.sha256(json.dumps([name, spec], sort_keys=True).encode()).hexdigest()
+    if key not in compiled:
+        try:
+            compiled[key] = Pipeline(name, PipelineSpec.model_validate(spec or {}), key)
+        except ValidationError as e:
+            raise ValueError(f'Invalid pipeline \'{name}\': {e}') from e
+    return compiled[key]
+
+
+def path(name: str) -> Path:
+    """
+    File of a pipeline
+
+    :param name: name of the pipeline
+    :return: path
+    """
+    for suffix in SUFFIXES:
+        file = PIPELINES_DIR / f'{name}{suffix}'
+        if file.parent == PIPELINES_DIR and file.is_file():
+            return file
+    raise ValueError(f'Unknown pipeline \'{name}\'')
+
+
+def load(name: str) -> Pipeline:
+    """
+    Get a pipeline by name, the file is only read again after it changed
+
+    :param name: name of the pipeline (file name without suffix)
+    :return: pipeline
+    """
+    file = path(name)
+    mtime = file.stat().st_mtime
+    if name in _files and _files[name][0] == mtime and _files[name][1] in compiled:
+        return compiled[_files[name][1]]
+
+    with open(file, 'r') as f:
+        # JSON is valid YAML
+        pipeline = build(name, yaml.safe_load(f))
+    _files[name] = (mtime, pipeline.key)
+    return pipeline
+
+
+def available() -> list[str]:
+    """
+    Names of all pipelines
+
+    :return: names
+    """
+    if not PIPELINES_DIR.is_dir():
+        return list()
+    return sorted(file.stem for file in PIPELINES_DIR.iterdir() if file.suffix in SUFFIXES)
@@ -0,0 +1,132 @@
+"""
+Pool of pre-built teams for stateless requests, so role construction is off the request path.
+"""
+
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from rich import print
+
+from agents.agents import Team, ChatRole, SupervisorRole
+from settings import settings
+
+
+class TeamPool:
+    """
+    Idle teams without history, keyed by shape (number of agents, number of supervisors).
+    A team is checked out for a single request and reset when it is returned.
+    """
+
+    def __init__(self, size: int = 8, shapes: list[list[int]] | None = None):
+        """
+        Constructor for TeamPool class
+
+        :param size: maximum number of idle teams per shape
+        :param shapes: shapes [agents, supervisors] to build teams for in advance
+        """
+        self.size = size
+        self.shapes = [tuple(shape) for shape in shapes or list()]
+        self._idle: dict[tuple[int, int], list[Team]] = dict()
+        # stats
+        self.hits = 0
+        self.misses = 0
+        self.discarded = 0
+        self._in_use: Counter = Counter()
+
+    @staticmethod
+    def build(agents: int, supervisors: int) -> Team:
+        """
+        Build a new team
+
+        :param agents: number of agents
+        :param supervisors: number of supervisors
+        :return: team
+        """
+        return Team(agents=[ChatRole() for _ in range(agents)],
+                    supervisors=[SupervisorRole() for _ in range(supervisors)])
+
+    def prewarm(self) -> None:
+        """
+        Fill the pool up to its size for all configured shapes
+
+        :return: None
+        """
+        for shape in self.shapes:
+            idle = self._idle.setdefault(shape, list())
+            while len(idle) < self.size:
+                idle.append(self.build(*shape))
+        if self.shapes:
+            print(f'[bold cyan]Pre-built {self.size} teams for shapes {self.shapes}[/]')
+
+    def checkout(self, agents: int, supervisors: int) -> Team:
+        """
+        Take an idle team of the given shape, builds a new one if there is none
+
+        :param agents: number of agents
+        :param supervisors: number of supervisors
+        :return: team
+        """
+        shape = (agents, supervisors)
+        self._in_use[shape] += 1
+        idle = self._idle.get(shape)
+        if idle:
+            self.hits += 1
+            return idle.pop()
+        self.misses += 1
+        return self.build(agents, supervisors)
+
+    def checkin(self, team: Team) -> None:
+        """
+        Return a team to the pool, its conversation is forgotten
+
+        :param team: team taken with checkout
+        :return: None
+        """
+        shape = (len(team.agents), len(team.supervisors))
+        self._in_use[shape] -= 1
+        idle = self._idle.setdefault(shape, list())
+        if team.busy or len(idle) >= self.size:
+            self.discarded += 1
+            return
+        team.reset()
+        idle.append(team)
+
+    @asynccontextmanager
+    async def team(self, agents: int, supervisors: int) -> AsyncIterator[Team]:
+        """
+        Borrow a team for the enclosed block
+
+        :param agents: number of agents
+        :param supervisors: number of supervisors
+        :return: context manager yielding the team
+        """
+        team = self.checkout(agents, supervisors)
+        try:
+            yield team
+        except BaseException:
+            # the run was interrupted, a role might still be in an undefined state
+            self._in_use[(agents, supervisors)] -= 1
+            self.discarded += 1
+            raise
+        self.checkin(team)
+
+    def stats(self) -> dict:
+        """
+        Idle and checked out teams by shape, hits and misses
+
+        :return: stats
+        """
+        return {
+            "size": self.size,
+            "idle": {f'{a}x{s}': len(idle) for (a, s), idle in self._idle.items()},
+            "in_use": {f'{a}x{s}': count for (a, s), count in self._in_use.items() if count},
+            "hits": self.hits,
+            "misses": self.misses,
+            "discarded": self.discarded,
+            "hit_rate": self.hits / (self.hits + self.misses) if self.hits + self.misses else 0.0,
+        }
+
+
+# teams for the /nosession endpoints
+teams = TeamPool(**settings['pool'])
@@ -0,0 +1,242 @@
+"""
+Process wide scheduler for LLM calls: priorities, per backend limits and fair sharing across sessions.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator
+
+from settings import settings
+
+# priorities, lower is served first
+INTERACTIVE = 0
+STATELESS = 1
+BACKGROUND = 2
+
+# priority and session key of the LLM calls made in the current context
+priority: ContextVar[int] = ContextVar('priority', default=STATELESS)
+session: ContextVar[str | None] = ContextVar('session', default=None)
+
+
+def enter(level: int, session_key: str | None = None) -> None:
+    """
+    Set the priority and session key for the LLM calls of the current request
+
+    :param level: priority
+    :param session_key: session key the calls are accounted to
+    :return: None
+    """
+    priority.set(level)
+    session.set(session_key)
+
+
+class Ticket:
+    """
+    A call waiting for a slot
+    """
+    __slots__ = ('tokens', 'future', 'enqueued')
+
+    def __init__(self, tokens: int):
+        self.tokens = tokens
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.enqueued = time.monotonic()
+
+
+class Slot:
+    """
+    A granted slot, used to account the response tokens of the call
+    """
+    __slots__ = ('scheduler',)
+
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+
+    def charge(self, tokens: int) -> None:
+        """
+        Charge tokens to the rate limit of the backend
+
+        :param tokens: number of (estimated) tokens
+        :return: None
+        """
+        self.scheduler.charge(tokens)
+
+
+class Scheduler:
+    """
+    Grants slots for LLM calls to one backend.
+    Calls are served by priority; within a priority the sessions take turns (round robin),
+    so a single session with many agents can't starve the others.
+    """
+
+    def __init__(self, name: str, concurrency: int = 4, tokens_per_second: float | None = None):
+        """
+        Constructor for Scheduler class
+
+        :param name: name of the backend
+        :param concurrency: maximum number of calls in flight
+        :param tokens_per_second: maximum (estimated) token throughput, None for no limit
+        """
+        self.name = name
+        self.concurrency = concurrency
+        self.tokens_per_second = tokens_per_second
+        # priority -> session key -> waiting tickets
+        self._queues: dict[int, OrderedDict[str | None, deque[Ticket]]] = dict()
+        self._in_flight = 0
+        # token bucket, holds up to one second worth of tokens
+        self._tokens = float(tokens_per_second or 0)
+        self._refilled = time.monotonic()
+        self._timer: asyncio.TimerHandle | None = None
+        # stats
+        self.dispatched = 0
+        self._waits: deque[float] = deque(maxlen=1024)
+
+    @asynccontextmanager
+    async def slot(self, tokens: int = 0) -> AsyncIterator[Slot]:
+        """
+        Wait for a slot for a call
+
+        :param tokens: (estimated) prompt tokens of the call
+        :return: context manager holding the slot
+        """
+        ticket = Ticket(tokens)
+        self._queues.setdefault(priority.get(), OrderedDict()).setdefault(session.get(), deque()).append(ticket)
+        self.__dispatch()
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            if ticket.future.done() and not ticket.future.cancelled():
+                # granted just before we got cancelled
+                self.__release()
+            # a cancelled ticket is skipped when it comes up in the queue
+            ticket.future.cancel()
+            raise
+
+        try:
+            yield Slot(self)
+        finally:
+            self.__release()
+
+    def charge(self, tokens: int) -> None:
+        """
+        Charge tokens to the rate limit
+
+        :param tokens: number of (estimated) tokens
+        :return: None
+        """
+        if self.tokens_per_second:
+            self.__refill()
+            self._tokens -= tokens
+
+    def __release(self) -> None:
+        self._in_flight -= 1
+        self.__dispatch()
+
+    def __refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.tokens_per_second, self._tokens + (now - self._refilled) * self.tokens_per_second)
+        self._refilled = now
+
+    def __next(self) -> Ticket | None:
+        """
+        Pop the next ticket: highest priority first, sessions take turns within a priority
+
+        :return: ticket or None if nothing is waiting
+        """
+        for level in sorted(self._queues):
+            sessions = self._queues[level]
+            while sessions:
+                key, tickets = next(iter(sessions.items()))
+                ticket = tickets.popleft()
+                if tickets:
+                    sessions.move_to_end(key)
+                else:
+                    del sessions[key]
+                if not ticket.future.done():
+                    return ticket
+        return None
+
+    def __dispatch(self) -> None:
+        while self._in_flight < self.concurrency:
+            if self.tokens_per_second:
+                self.__refill()
+                if self._tokens <= 0:
+                    # out of tokens, try again once the bucket has refilled a bit
+                    if self._timer is None and self.waiting:
+                        delay = (1 - self._tokens) / self.tokens_per_second
+                        self._timer = asyncio.get_running_loop().call_later(delay, self.__wake)
+                    return
+            ticket = self.__next()
+            if ticket is None:
+                return
+            self._in_flight += 1
+            self.charge(ticket.tokens)
+            self.dispatched += 1
+            self._waits.append(time.monotonic() - ticket.enqueued)
+            ticket.future.set_result(None)
+
+    def __wake(self) -> None:
+        self._timer = None
+        self.__dispatch()
+
+    @property
+    def waiting(self) -> int:
+        """
+        Number of calls waiting for a slot
+
+        :return: queue depth
+        """
+        return sum(1 for sessions in self._queues.values() for tickets in sessions.values()
+                   for ticket in tickets if not ticket.future.done())
+
+    def stats(self) -> dict:
+        """
+        Queue depth, calls in flight and wait times
+
+        :return: stats
+        """
+        waits = sorted(self._waits)
+        return {
+            "concurrency": self.concurrency,
+            "tokens_per_second": self.tokens_per_second,
+            "in_flight": self._in_flight,
+            "waiting": self.waiting,
+            "waiting_by_priority": {
+                level: sum(1 for tickets in sessions.values() for ticket in tickets if not ticket.future.done())
+                for level, sessions in self._queues.items()
+            },
+            "dispatched": self.dispatched,
+            "wait_avg": sum(waits) / len(waits) if waits else 0.0,
+            "wait_p50": waits[len(waits) // 2] if waits else 0.0,
+            "wait_p99": waits[int(len(waits) * 0.99)] if waits else 0.0,
+            "wait_max": waits[-1] if waits else 0.0,
+        }
+
+
+# one scheduler per backend
+schedulers: dict[str, Scheduler] = dict()
+
+
+def for_backend(name: str) -> Scheduler:
+    """
+    Get the scheduler for a backend, created with the limits from the settings
+
+    :param name: name of the backend (base url)
+    :return: scheduler
+    """
+    if name not in schedulers:
+        limits = {**settings['scheduler']['default'], **settings['scheduler']['backends'].get(name, {})}
+        schedulers[name] = Scheduler(name, concurrency=limits['concurrency'],
+                                     tokens_per_second=limits['tokens_per_second'])
+    return schedulers[name]
+
+
+def stats() -> dict:
+    """
+    Stats of all schedulers
+
+    :return: stats by backend
+    """
+    return {name: scheduler.stats() for name, scheduler in schedulers.items()}
@@ -1,16 +1,42 @@
 from agents import Team, SupervisorRole, ChatRole
+from agents import streaming, pipelines
 from uuid import uuid4
 import sqlalchemy as sql
-from sqlalchemy import Table, Column, Integer, String, MetaData, Text
+from sqlalchemy import Table, Column, Integer, String, MetaData, Text, Index
 from pathlib import Path
 import pickle
-from configurations import Configuration
+import os
+from configurations import Configuration, configurator
+from migrations import add_missing_columns, add_missing_indexes
+from settings import settings
+from persistence import database
+from rich import print
+from collections import OrderedDict
+import asyncio
 import json
+import time
 
 THIS_DIR = Path(__file__).parent
-SQLALCHEMY_DATABASE_URL = f"sqlite:///{THIS_DIR}/sessions.sqlite"
+# LUMIN_SESSIONS_DB: other database file, e.g. a temporary one for benchmarks
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{os.environ.get('LUMIN_SESSIONS_DB', THIS_DIR / 'sessions.sqlite')}"
 
 engine = sql.create_engine(SQLALCHEMY_DATABASE_URL)
+# number of queries sent to the database, see stats()
+queries = 0
+
+
+@sql.event.listens_for(engine, 'connect')
+def _attach_configurations(dbapi_connection, connection_record):
+    # the configurations live in their own database, attached to load a session with its configuration at once
+    dbapi_connection.execute('ATTACH DATABASE ? AS configs', (configurator.engine.url.database,))
+
+
+@sql.event.listens_for(engine, 'before_cursor_execute')
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    global queries
+    queries += 1
+
+
 metadata = MetaData()
 metadata.reflect(bind=engine)
 
@@ -22,18 +48,62 @@ tables = {
         Column("session_key", String),
         Column("history", Text),
         Column("name", String, nullable=True),
+        # pickled team of sessions saved before the message log, empty otherwise
         Column("team", Text, nullable=False),
+        # compaction state of the team, see Team.summary
+        Column("summary", Text, nullable=True),
+        Column("summarized", Integer, nullable=True),
+        # incremented by every save, a save expecting another version lost an update
+        Column("version", Integer, nullable=True),
+        # sessions are looked up by their key
+        Index("ix_sessions_session_key", "session_key"),
+        extend_existing=True,
+    ),
+    # append-only log of the conversations
+    "messages": Table(
+        "messages", metadata,
+        Column("session_uid", Integer, primary_key=True),
+        Column("seq", Integer, primary_key=True),
+        Column("role", String),
+        Column("agent", String, nullable=True),
+        Column("content", Text),
         extend_existing=True,
     ),
 }
 
-# create tables if not exist
-metadata.create_all(bind=engine)
+
+
+def migrate() -> None:
+    """
+    Create missing tables, columns and indexes in the sessions database.
+    Called once at startup (see app.py), not at import, so importing this module never writes to the database.
+
+    :return: None
+    """
+    metadata.create_all(bind=engine)
+    for table in tables.values():
+        add_missing_columns(engine, table)
+        add_missing_indexes(engine, table)
+
+
+# configurations table as seen from the sessions database
+config_table = configurator.tables["configurations"].to_metadata(MetaData(), schema="configs")
+
+
+class SessionConflict(RuntimeError):
+    """
+    The session was changed (or deleted) in the database since it was loaded, e.g. by another process
+    """
+
+
+# estimated bytes of a role (agent or supervisor) without its memories
+ROLE_FOOTPRINT = 4096
 
 
 class Session:
     def __init__(self, config_uid: int, session_key: str | None = None, uid: int | None = None,
-                 name: str | None = None, history: list[tuple[str, str]] | None = None):
+                 name: str | None = None, config: Configuration | None = None, stored: tuple | None = None,
+                 version: int = 0):
         # configuration uid
         self.config_uid = config_uid
         # session key
@@ -43,15 +113,28 @@ class Session:
         # name
         self.name = name
 
-        self._config = Configuration.grab(config_uid)
+        self._config = config or Configuration.grab(config_uid)
         self._agent_count = self._config.agent_count
         self._supervisor_count = self._config.supervisor_count
         self._team = None
-        self.team.history = list()
+        # conversation as loaded from the database (history, summary, summarized, pickled team), see Session.load
+        self._stored = stored
+        # whether the session is in the database, None if unknown
+        self._exists = True if stored is not None else (False if session_key is None else None)
+        # number of history entries in the message log
+        self._saved = 0
+        # version of the row in the database this session is based on
+        self._version = version
+        # number of messages being answered or waiting for their turn
+        self._running = 0
+        # messages are answered one at a time, in order
+        self._lock = asyncio.Lock()
 
     @property
     def exists(self) -> bool:
-        return True if Session.check(self.key) else False
+        if self._exists is None:
+            self._exists = Session.check(self.key)
+        return self._exists
 
     @property
     def team(self):
@@ -59,23 +142,77 @@ class Session:
             # team already loaded into memory
             return self._team
 
-        if self.exists:
-            # find the team in database and load it into memory
-            with engine.connect() as conn:
-                pickle_team = conn.execute(
-                    sql.select(tables["sessions"].c.team).where(tables["sessions"].c.session_key == self.key)
-                ).first()[0]
-                self._team = pickle.loads(pickle_team)
-                return self._team
+        if self._stored is None and self.exists:
+            # session saved, but not loaded yet
+            loaded = Session.find(self.key)
+            self.uid, self._stored, self._version = loaded.uid, loaded._stored, loaded._version
+
+        if self._stored is not None:
+            # rebuild the team from the configuration and the message log
+            self._team = self.__load_team()
+            return self._team
 
         else:
             # create a new team
-            agents = [ChatRole() for i in range(self._agent_count)]
-            supervisors = [SupervisorRole() for i in range(self._supervisor_count)]
-            self._team = Team(agents=agents, supervisors=supervisors)
+            self._team = self.__new_team()
             self.save()
             return self._team
 
+    def __new_team(self) -> Team:
+        """
+        Build a team as described by the configuration
+
+        :return: team without history
+        """
+        if self._config.pipeline:
+            team = pipelines.load(self._config.pipeline).team(self._agent_count, self._supervisor_count)
+        else:
+            agents = [ChatRole() for i in range(self._agent_count)]
+            supervisors = [SupervisorRole() for i in range(self._supervisor_count)]
+            team = Team(agents=agents, supervisors=supervisors)
+        team.on_compacted = self.__compacted
+        return team
+
+    def __compacted(self) -> None:
+        """
+        Save the new summary of a background compaction, so it isn't lost if the server stops before the next message
+
+        :return: None
+        """
+        try:
+            writer.mark(self)
+        except SessionConflict as e:
+            print(f'[bold red]could not save the summary: {e}[/]')
+
+    def __load_team(self) -> Team:
+        """
+        Build the team and restore the conversation loaded from the message log.
+        Sessions saved before the message log are converted once.
+
+        :return: team
+        """
+        history, summary, summarized, pickled, legacy_history = self._stored
+        self._stored = None
+
+        team = self.__new_team()
+        if history or not pickled:
+            team.restore(history, summary=summary or '', summarized=summarized or 0)
+            self._saved = len(history)
+            return team
+
+        # saved before the message log: take the history from the pickled team (or the json copy if that fails)
+        try:
+            legacy = pickle.loads(pickled)
+            team.restore(legacy.history, summary=legacy.summary, summarized=legacy.summarized)
+        except Exception as e:
+            print(f'[bold red]could not unpickle team of session {self.key}: {e!r}[/]')
+            team.restore([tuple(entry) for entry in json.loads(legacy_history or '[]')])
+        self._team = team
+        self._saved = 0
+        self.save()
+        print(f'[bold cyan]Moved session {self.key} to the message log[/]')
+        return team
+
     async def send(self, msg):
         """
         Send a message to the team
@@ -83,17 +220,68 @@ class Session:
         :param msg: message to send
         :return: None
         """
-        response = await self.team(msg)
-        self.save()
+        self._running += 1
+        try:
+            async with self._lock:
+                # fail before the team changes, not after it answered
+                writer.check(self)
+                team = self.team
+                before = (list(team.history), team.summary, team.summarized)
+                response = await team(msg)
+                try:
+                    writer.mark(self)
+                except SessionConflict:
+                    # another copy was changed while answering, forget the turn
+                    team.restore(*before)
+                    raise
+        finally:
+            self._running -= 1
         return response
 
-    async def history(self):
+    @property
+    def busy(self) -> bool:
+        """
+        Whether a message is being answered or the team is still compacting its history
+
+        :return: True if busy
+        """
+        return self._running > 0 or (self._team is not None and self._team.busy)
+
+    def footprint(self) -> int:
+        """
+        Rough estimate of the memory used by the session in bytes: the text of the conversation,
+        held by the team and (up to their capacity) by each agent, plus a fixed amount per role
+
+        :return: bytes
+        """
+        if self._team is None:
+            history = self._stored[0] if self._stored else list()
+            return ROLE_FOOTPRINT + sum(len(content) for _, content in history)
+        team = self._team
+        size = ROLE_FOOTPRINT * (len(team.agents) + len(team.supervisors))
+        size += len(team.summary) + sum(len(content) for _, content in team.history)
+        for agent in team.agents:
+            size += len(agent.summary) + sum(len(turn) for turn in agent.memories)
+        return size
+
+    async def send_stream(self, msg):
+        """
+        Send a message to the team and stream its progress
+
+        :param msg: message to send
+        :return: async iterator of events, the last one being 'final' (or 'error')
+        """
+        async for event in streaming.stream(self.send(msg)):
+            yield event
+
+    async def history(self, since: int = 0):
         """
         Retrieve the history of the session
 
+        :param since: number of messages already known (seq of the first message returned)
         :return: list of messages
         """
-        return self.team.history
+        return self.team.history[since:]
 
     def save(self) -> None:
         """
@@ -101,39 +289,116 @@ class Session:
 
         :return: None
         """
-        # table for sessions
-        session_table = tables["sessions"]
+        if Session.save_all([self]):
+            raise SessionConflict(f'session {self.key} was changed since version {self._version}')
 
-        if not self.team:
-            # will save automatically due to save call in self.team()
-            # but makes sure that self._team is set when saving
-            return
+    @staticmethod
+    async def acreate(config_uid: int, session_key: str | None = None) -> 'Session':
+        """
+        Create and save a new session on the database thread pool
+
+        :param config_uid: configuration uid
+        :param session_key: key of the new session (e.g. chosen by the router of launcher.py), None for a random one
+        :return: Session object
+        """
+        def create():
+            if session_key and Session.check(session_key):
+                raise SessionConflict(f'session {session_key} already exists')
+            session = Session(config_uid, session_key)
+            session._exists = False
+            session.save()
+            return session
+        return await database.run(create)
+
+    async def aload(self) -> 'Session':
+        """
+        Build the team (unpickling legacy sessions) on the database thread pool
+
+        :return: self
+        """
+        if self._team is None:
+            await database.run(lambda: self.team)
+        return self
+
+    @staticmethod
+    def save_all(sessions: list) -> list:
+        """
+        Saves sessions into the database in a single transaction. Sessions changed in the database
+        since they were loaded are not saved.
+
+        :param sessions: Session objects
+        :return: the sessions not saved because of a conflict
+        """
+        # makes sure that the teams are loaded (new teams save themselves) before writing
+        sessions = [session for session in sessions if session.team]
+        if not sessions:
+            return list()
 
         with engine.connect() as conn:
-            if self.exists:
-                # update row in database
-                row = conn.execute(
-                    session_table.update().where(session_table.c.uid == self.uid).values(
-                        session_key=self.key,
-                        config_uid=self.config_uid,
-                        team=pickle.dumps(self._team),
-                        name=self.name,
-                        history=json.dumps(self.team.history)
-                    )
+            written = [session.__write(conn) for session in sessions]
+            conn.commit()
+        conflicts = list()
+        for session, count in zip(sessions, written):
+            if count is None:
+                conflicts.append(session)
+                continue
+            session._saved += count
+            session._version += 1
+            session._exists = True
+        return conflicts
+
+    def __write(self, conn) -> int | None:
+        """
+        Write the session row and append the new history entries to the message log
+
+        :param conn: database connection
+        :return: number of history entries written, None if the row is not at the expected version
+        """
+        # table for sessions
+        session_table = tables["sessions"]
+
+        if self.exists:
+            # update row in database, unless someone else did since it was loaded
+            rows = conn.execute(
+                session_table.update().where(
+                    session_table.c.uid == self.uid,
+                    sql.func.coalesce(session_table.c.version, 0) == self._version,
+                ).values(
+                    session_key=self.key,
+                    config_uid=self.config_uid,
+                    team='',
+                    name=self.name,
+                    history=None,
+                    summary=self._team.summary,
+                    summarized=self._team.summarized,
+                    version=self._version + 1,
                 )
-            else:
-                # insert row into database
-                rows = conn.execute(
-                    session_table.insert().values(
-                        config_uid=self.config_uid,
-                        session_key=self.key,
-                        team=pickle.dumps(self._team, protocol=None, fix_imports=True, buffer_callback=None),
-                        name=self.name,
-                        history=json.dumps(self.team.history)
-                    )
+            )
+            if rows.rowcount == 0:
+                return None
+        else:
+            # insert row into database
+            rows = conn.execute(
+                session_table.insert().values(
+                    config_uid=self.config_uid,
+                    session_key=self.key,
+                    team='',
+                    name=self.name,
+                    summary=self._team.summary,
+                    summarized=self._team.summarized,
+                    version=self._version + 1,
                 )
-                self.uid = rows.inserted_primary_key[0]
-            conn.commit()
+            )
+            self.uid = rows.inserted_primary_key[0]
+
+        # append the new history entries to the log
+        entries = self._team.history[self._saved:]
+        if entries:
+            conn.execute(tables["messages"].insert(), [
+                {"session_uid": self.uid, "seq": self._saved + i, "role": role, "agent": None, "content": content}
+                for i, (role, content) in enumerate(entries)
+            ])
+        return len(entries)
 
     @property
     def config(self):
@@ -147,6 +412,8 @@ class Session:
         """
         if not self.exists:
             return False
+        writer.discard(self)
+        Cache.remove(self.key)
 
         # table for sessions
         session_table = tables["sessions"]
@@ -155,9 +422,52 @@ class Session:
             conn.execute(
                 sql.delete(session_table).where(session_table.c.uid == self.uid)
             )
+            conn.execute(
+                sql.delete(tables["messages"]).where(tables["messages"].c.session_uid == self.uid)
+            )
             conn.commit()
+        self._exists = False
         return True
 
+    @staticmethod
+    async def apage(limit: int, after: int | None = None) -> list[tuple[int, str]]:
+        """
+        Retrieve a page of sessions on the database thread pool, see page
+
+        :param limit: maximum number of sessions
+        :param after: uid of the last session of the previous page, None for the first page
+        :return: uids and session keys
+        """
+        return await database.run(Session.page, limit, after)
+
+    @staticmethod
+    def page(limit: int, after: int | None = None) -> list[tuple[int, str]]:
+        """
+        Retrieve a page of sessions ordered by uid (keyset pagination, the cost doesn't grow with the offset)
+
+        :param limit: maximum number of sessions
+        :param after: uid of the last session of the previous page, None for the first page
+        :return: uids and session keys
+        """
+        # table for sessions
+        session_table = tables["sessions"]
+        query = sql.select(session_table.c.uid, session_table.c.session_key)
+        if after is not None:
+            query = query.where(session_table.c.uid > after)
+        # search in database
+        with engine.connect() as conn:
+            rows = conn.execute(query.order_by(session_table.c.uid).limit(limit)).all()
+        return [(row[0], row[1]) for row in rows]
+
+    @staticmethod
+    async def alist() -> list[str]:
+        """
+        Retrieve a list of all session keys on the database thread pool
+
+        :return: session keys
+        """
+        return await database.run(Session.list)
+
     @staticmethod
     def list() -> list[str]:
         """
@@ -170,34 +480,78 @@ class Session:
         # search in database
         with engine.connect() as conn:
             rows = conn.execute(
-                sql.select(session_table.c.session_key)
+                sql.select(session_table.c.session_key).order_by(session_table.c.uid)
             )
         return [row[0] for row in rows]
 
     @staticmethod
-    def grab(uid: int):
+    def load(where) -> 'Session | None':
         """
-        Grab a session from the database using the uid
+        Load a session with its configuration and conversation in a single query
 
-        :param uid: uid of the session
+        :param where: condition on the sessions table
         :return: Session object or None if not found
         """
-        # table for sessions
-        session_table = tables["sessions"]
+        # tables for sessions and messages
+        session_table, message_table = tables["sessions"], tables["messages"]
         # search in database
         with engine.connect() as conn:
-            row = conn.execute(
+            rows = conn.execute(
                 sql.select(
                     session_table.c.config_uid,
                     session_table.c.session_key,
                     session_table.c.uid,
                     session_table.c.name,
+                    session_table.c.summary,
+                    session_table.c.summarized,
+                    session_table.c.team,
                     session_table.c.history,
-                ).where(session_table.c.uid == uid)
-            ).first()
-            if not row:
-                return None
-            return Session(config_uid=row[0], session_key=row[1], uid=row[2], name=row[3], history=json.loads(row[4]))
+                    session_table.c.version,
+                    config_table.c.agent_count,
+                    config_table.c.supervisor_count,
+                    config_table.c.pipeline,
+                    message_table.c.role,
+                    message_table.c.content,
+                )
+                .select_from(
+                    session_table
+                    .outerjoin(config_table, config_table.c.uid == session_table.c.config_uid)
+                    .outerjoin(message_table, message_table.c.session_uid == session_table.c.uid)
+                )
+                .where(where)
+                .order_by(message_table.c.seq)
+            ).all()
+        if not rows:
+            return None
+
+        row = rows[0]
+        config = None
+        if row[9] is not None:
+            config = Configuration(agent_count=row[9], supervisor_count=row[10], uid=row[0], pipeline=row[11])
+        history = [(role, content) for *_, role, content in rows if role is not None]
+        return Session(config_uid=row[0], session_key=row[1], uid=row[2], name=row[3], config=config,
+                       stored=(history, row[4], row[5], row[6], row[7]), version=row[8] or 0)
+
+    @staticmethod
+    async def afind(session_key: str) -> 'Session | None':
+        """
+        Load a session and its team on the database thread pool, see find
+
+        :param session_key: Session key
+        :return: Session object or None if not found
+        """
+        session = await database.run(Session.find, session_key)
+        return await session.aload() if session else None
+
+    @staticmethod
+    def grab(uid: int):
+        """
+        Grab a session from the database using the uid
+
+        :param uid: uid of the session
+        :return: Session object or None if not found
+        """
+        return Session.load(tables["sessions"].c.uid == uid)
 
     @staticmethod
     def check(session_key: str) -> bool:
@@ -224,22 +578,7 @@ class Session:
         :param session_key: Session key
         :return: Session object or None if not found
         """
-        # table for sessions
-        session_table = tables["sessions"]
-        # search in database
-        with engine.connect() as conn:
-            row = conn.execute(
-                sql.select(
-                    session_table.c.config_uid,
-                    session_table.c.session_key,
-                    session_table.c.uid,
-                    session_table.c.name,
-                    session_table.c.history,
-                ).where(session_table.c.session_key == session_key)
-            ).first()
-            if not row:
-                return None
-            return Session(config_uid=row[0], session_key=row[1], uid=row[2], name=row[3], history=json.loads(row[4]))
+        return Session.load(tables["sessions"].c.session_key == session_key)
 
     @staticmethod
     def __gen_session_key():
@@ -249,8 +588,177 @@ class Session:
         return f'<Session: {self.key}\\[exists: {self.exists}, uid: {self.uid}]>'
 
 
+class WriteBehind:
+    """
+    Saves sessions in the background after their requests: a session changed several times
+    before the next flush is written once, and all pending sessions in one transaction.
+    """
+
+    def __init__(self, interval: float = 0.5):
+        """
+        Constructor for WriteBehind class
+
+        :param interval: seconds between flushes
+        """
+        self.interval = interval
+        self._dirty: dict[str, Session] = dict()
+        # sessions being saved right now
+        self._flushing: dict[str, Session] = dict()
+        self._task: asyncio.Task | None = None
+        # stats
+        self.marked = 0
+        self.coalesced = 0
+        self.flushes = 0
+        self.written = 0
+        self.conflicts = 0
+        self.errors = 0
+        self.lost = 0
+        # history entries dropped by conflicts when flushing, by session key, reported by the next request
+        self.dropped: dict[str, int] = dict()
+
+    def check(self, session: Session) -> None:
+        """
+        Raise SessionConflict if the session can't be saved because another copy of it has unsaved changes
+
+        :param session: Session object
+        :return: None
+        """
+        pending = self.pending(session.key)
+        if pending is not None and pending is not session:
+            # two copies of one session were changed, saving this one would silently drop the other's changes
+            self.conflicts += 1
+            raise SessionConflict(f'session {session.key} has unsaved changes of another copy')
+
+    def mark(self, session: Session) -> None:
+        """
+        Schedule a session to be saved
+
+        :param session: Session object
+        :return: None
+        """
+        self.check(session)
+        self.marked += 1
+        if session.key in self._dirty:
+            self.coalesced += 1
+        self._dirty[session.key] = session
+        if not self._task or self._task.done():
+            self._task = asyncio.create_task(self.__run())
+
+    def discard(self, session: Session) -> bool:
+        """
+        Don't save a session (e.g. because it is deleted or saved right away)
+
+        :param session: Session object
+        :return: whether the session had changes pending
+        """
+        return self._dirty.pop(session.key, None) is not None
+
+    def pending(self, session_key: str) -> Session | None:
+        """
+        Session with changes not saved yet, it is more recent than the database
+
+        :param session_key: session key
+        :return: Session object or None
+        """
+        return self._dirty.get(session_key) or self._flushing.get(session_key)
+
+    async def __run(self) -> None:
+        while self._dirty:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def flush(self) -> None:
+        """
+        Save all pending sessions now
+
+        :return: None
+        """
+        self._flushing, self._dirty = self._dirty, dict()
+        batch = list(self._flushing.values())
+        if not batch:
+            return
+        try:
+            conflicts = await database.run(Session.save_all, batch)
+        except Exception as e:
+            self.errors += 1
+            print(f'[bold red]could not save {len(batch)} session(s): {e!r}[/]')
+            # try again with the next flush, unless changed or deleted in the meantime
+            for session in batch:
+                if session.exists is not False:
+                    self._dirty.setdefault(session.key, session)
+            return
+        finally:
+            self._flushing = dict()
+        self.flushes += 1
+        self.written += len(batch) - len(conflicts)
+        for session in conflicts:
+            # the database is ahead of this copy: drop it, the session is loaded again on its next use
+            self.conflicts += 1
+            dropped = len(session.team.history) - session._saved
+            self.dropped[session.key] = self.dropped.get(session.key, 0) + dropped
+            self.lost += dropped
+            print(f'[bold red]session {session.key} was changed elsewhere since version {session._version}, '
+                  f'dropping {dropped} unsaved entries[/]')
+            Cache.remove(session.key)
+
+    async def close(self) -> None:
+        """
+        Stop the background task and save all pending sessions
+
+        :return: None
+        """
+        if self._task and not self._task.done():
+            self._task.cancel()
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._dirty),
+            "marked": self.marked,
+            "coalesced": self.coalesced,
+            "flushes": self.flushes,
+            "written": self.written,
+            "conflicts": self.conflicts,
+            "lost": self.lost,
+            "errors": self.errors,
+        }
+
+
+writer = WriteBehind(settings['sessions']['flush_interval'])
+
+
+def stats() -> dict:
+    """
+    Stats of the session persistence
+
+    :return: stats
+    """
+    return {"queries": queries, **writer.stats(), "cache": Cache.stats()}
+
+
 class Cache:
-    cache: dict[str, Session] = dict()
+    """
+    Sessions in memory, least recently used first. Bounded by the number of sessions and their
+    estimated size, sessions not used within the TTL expire. Dropped sessions with pending changes
+    stay with the write-behind queue until they are saved (and are taken from there if located
+    again), sessions still answering a message are never dropped.
+    """
+    cache: OrderedDict[str, Session] = OrderedDict()
+    # estimated bytes (see Session.footprint) and time of the last use of the cached sessions
+    sizes: dict[str, int] = dict()
+    used: dict[str, float] = dict()
+    # sessions being loaded from the database
+    loading: dict[str, asyncio.Future] = dict()
+
+    size: int = settings['sessions']['cache_size']
+    max_bytes: int | None = settings['sessions']['cache_bytes']
+    ttl: float | None = settings['sessions']['cache_ttl']
+
+    # stats
+    hits = 0
+    misses = 0
+    evictions = 0
+    expirations = 0
 
     @staticmethod
     def find(session_key: str) -> Session | None:
@@ -260,7 +768,13 @@ class Cache:
         :param session_key: session key
         :return: Session object or None if not found
         """
-        return Cache.cache.get(session_key)
+        if not Cache.check(session_key):
+            return None
+        session = Cache.cache[session_key]
+        Cache.cache.move_to_end(session_key)
+        Cache.sizes[session_key] = session.footprint()
+        Cache.used[session_key] = time.monotonic()
+        return session
 
     @staticmethod
     def check(session_key: str) -> bool:
@@ -270,27 +784,136 @@ class Cache:
         :param session_key:
         :return: True if found, False otherwise
         """
-        return session_key in Cache.cache
+        if session_key not in Cache.cache:
+            return False
+        if Cache.__expired(session_key) and not Cache.cache[session_key].busy:
+            Cache.expirations += 1
+            Cache.remove(session_key)
+            return False
+        return True
 
     @staticmethod
     def add(session: Session) -> None:
         """
-        Add a session to the cache
+        Add a session to the cache, evicts the least recently used sessions if the cache is full
 
         :param session: Session object
         :return: None
         """
         Cache.cache[session.key] = session
+        Cache.cache.move_to_end(session.key)
+        Cache.sizes[session.key] = session.footprint()
+        Cache.used[session.key] = time.monotonic()
+        Cache.__evict()
+
+    @staticmethod
+    def remove(session_key: str) -> None:
+        """
+        Drop a session from the cache
+
+        :param session_key: session key
+        :return: None
+        """
+        Cache.cache.pop(session_key, None)
+        Cache.sizes.pop(session_key, None)
+        Cache.used.pop(session_key, None)
 
     @staticmethod
     def locate(session_key: str) -> Session | None:
         """
-        Locate a session in cache or from db
+        Locate a session in cache or from db, sessions from the db are added to the cache
 
         :param session_key: session key
         :return: the session or none
         """
-        if Cache.check(session_key):
-            return Cache.find(session_key)
-        else:
-            return Session.find(session_key)
+        session = Cache.find(session_key)
+        if session:
+            Cache.hits += 1
+            return session
+
+        Cache.misses += 1
+        session = writer.pending(session_key) or Session.find(session_key)
+        if session:
+            Cache.add(session)
+        return session
+
+    @staticmethod
+    async def alocate(session_key: str) -> Session | None:
+        """
+        Locate a session in cache or from db, loading it on the database thread pool, see locate
+
+        :param session_key: session key
+        :return: the session or none
+        """
+        dropped = writer.dropped.pop(session_key, 0)
+        if dropped:
+            # the client got answers for these entries, tell it once that they are gone
+            raise SessionConflict(f'session {session_key} was changed elsewhere, {dropped} unsaved history '
+                                  f'entries were dropped, read the history again')
+        session = Cache.find(session_key)
+        if session:
+            Cache.hits += 1
+            return session
+
+        Cache.misses += 1
+        session = writer.pending(session_key)
+        if session is None:
+            # concurrent requests for the same session wait for the same load, so they share one Session object
+            loading = Cache.loading.get(session_key)
+            if loading is None:
+                loading = Cache.loading[session_key] = asyncio.ensure_future(Session.afind(session_key))
+                loading.add_done_callback(lambda _: Cache.loading.pop(session_key, None))
+            session = await asyncio.shield(loading)
+            # added by a request which was quicker
+            session = Cache.cache.get(session_key, session)
+        if session:
+            Cache.add(session)
+        return session
+
+    @staticmethod
+    def __expired(session_key: str) -> bool:
+        return Cache.ttl is not None and time.monotonic() - Cache.used[session_key] > Cache.ttl
+
+    @staticmethod
+    def __evict() -> None:
+        # expired sessions: the least recently used come first
+        for key in list(Cache.cache):
+            if not Cache.__expired(key):
+                break
+            if not Cache.cache[key].busy:
+                Cache.expirations += 1
+                Cache.remove(key)
+
+        # least recently used sessions until the cache fits its bounds again
+        for key in list(Cache.cache):
+            if len(Cache.cache) <= Cache.size and (Cache.max_bytes is None or Cache.bytes() <= Cache.max_bytes):
+                break
+            if not Cache.cache[key].busy:
+                Cache.evictions += 1
+                Cache.remove(key)
+
+    @staticmethod
+    def bytes() -> int:
+        """
+        Estimated size of the cached sessions
+
+        :return: bytes
+        """
+        return sum(Cache.sizes.values())
+
+    @staticmethod
+    def stats() -> dict:
+        """
+        Cached sessions, hits, misses and evictions
+
+        :return: stats
+        """
+        return {
+            "entries": len(Cache.cache),
+            "bytes": Cache.bytes(),
+            "hits": Cache.hits,
+            "misses": Cache.misses,
+            "evictions": Cache.evictions,
+            "expirations": Cache.expirations,
+            "hit_rate": Cache.hits / (Cache.hits + Cache.misses) if Cache.hits + Cache.misses else 0.0,
+        }
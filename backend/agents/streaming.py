@@ -0,0 +1,102 @@
+"""
+Streaming of team progress: phase events and the draft tokens of one agent.
+"""
+
+import asyncio
+import json
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Awaitable
+
+from metagpt import logs
+
+# queue receiving the events of the current request, None if nobody is listening
+events: ContextVar[asyncio.Queue | None] = ContextVar('events', default=None)
+# index of the agent whose tokens are generated in the current task
+_drafting: ContextVar[int | None] = ContextVar('drafting', default=None)
+
+# agent whose drafts are streamed to the client
+DRAFT_AGENT = 0
+
+
+def emit(event: str, **data) -> None:
+    """
+    Emit an event to the listener of the current request (if any)
+
+    :param event: name of the event
+    :param data: event payload
+    :return: None
+    """
+    queue = events.get()
+    if queue is not None:
+        queue.put_nowait({'event': event, **data})
+
+
+def draft(call: Awaitable, agent: int) -> Awaitable:
+    """
+    Forward the tokens generated while awaiting call as 'token' events if agent is the draft agent
+
+    :param call: agent call
+    :param agent: index of the agent
+    :return: awaitable
+    """
+    if agent != DRAFT_AGENT:
+        return call
+    return _forward(call, agent)
+
+
+async def _forward(call: Awaitable, agent: int) -> Any:
+    token = _drafting.set(agent)
+    try:
+        return await call
+    finally:
+        _drafting.reset(token)
+
+
+def _log_llm_stream(msg: str, default=logs._llm_stream_log) -> None:
+    # metagpt reports every streamed chunk through this hook
+    default(msg)
+    agent = _drafting.get()
+    if agent is not None:
+        emit('token', agent=agent, text=msg)
+
+
+logs.set_llm_stream_logfunc(_log_llm_stream)
+
+
+async def stream(call: Awaitable) -> AsyncIterator[dict]:
+    """
+    Run call and yield the events it emits, followed by a 'final' event with its result
+    (or an 'error' event if it failed)
+
+    :param call: awaitable emitting events, e.g. a team call
+    :return: async iterator of events
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    token = events.set(queue)
+    try:
+        # the task copies the current context and with it the queue
+        task = asyncio.ensure_future(call)
+    finally:
+        events.reset(token)
+    task.add_done_callback(lambda _: queue.put_nowait(None))
+
+    # if the client goes away the task keeps running, so the turn is still completed and saved
+    while (event := await queue.get()) is not None:
+        yield event
+
+    if task.cancelled():
+        yield {'event': 'error', 'detail': 'cancelled'}
+    elif task.exception():
+        yield {'event': 'error', 'detail': str(task.exception())}
+    else:
+        yield {'event': 'final', 'response': task.result()}
+
+
+def sse(event: dict) -> str:
+    """
+    Format an event as a Server-Sent Event
+
+    :param event: event
+    :return: SSE message
+    """
+    return f'event: {event["event"]}\ndata: {json.dumps(event)}\n\n'
@@ -4,15 +4,86 @@ Contains templates for metagpt roles.
 
 import re
 import asyncio
+import time
 import typing
 from random import choice
+from string import Formatter
+from typing import ClassVar, Optional
 
 from metagpt.actions import Action
 from metagpt.roles import Role
+from metagpt.provider.ollama_api import OllamaLLM
+from metagpt.provider.openai_api import OpenAILLM
 from metagpt.schema import Message
 from metagpt.logs import logger
 import json
 
+from agents import cache, scheduler, tracing
+from settings import settings
+
+# replaces the metagpt LLM of every action if set, e.g. agents.mock.MockLLM for offline benchmarks
+provider = None
+
+
+def set_provider(llm) -> None:
+    """
+    Send all LLM calls of dynamic actions to the given provider instead of the configured metagpt LLM
+
+    :param llm: object with an async aask(prompt, system_msgs, action) method and a name, None to reset
+    :return: None
+    """
+    global provider
+    provider = llm
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough estimate of the number of tokens in a text (~4 characters per token)
+
+    :param text: text
+    :return: estimated token count
+    """
+    return len(text) // 4 + 1
+
+
+NAMES = [
+    'Alice', 'Bob', 'Charlie', 'David', 'Eve', 'Frank', 'Grace', 'Thomas',
+    'Hannah', 'Ivy', 'Jack', 'Katie', 'Liam', 'Mia', 'Noah', 'Olivia', 'Zaid',
+    'Parker', 'Quinn', 'Ryan', 'Sophia', 'Tyler', 'Uma', 'Victor', 'Willow',
+]
+
+
+def random_name() -> str:
+    """
+    Pick a funky name
+
+    :return: name
+    """
+    return choice(NAMES)
+
+
+def constrain_json(llm) -> bool:
+    """
+    Let the backend only generate valid JSON (grammar constrained decoding), if it supports it.
+    Use only for actions whose output is a JSON object.
+
+    :param llm: metagpt LLM, must not be shared with actions that answer in text
+    :return: True if the output is constrained
+    """
+    if getattr(llm, 'json_output', False):
+        return True
+    if isinstance(llm, OllamaLLM):
+        const_kwargs = llm._const_kwargs
+        llm._const_kwargs = lambda messages, stream=False: {**const_kwargs(messages, stream), "format": "json"}
+    elif isinstance(llm, OpenAILLM):
+        cons_kwargs = llm._cons_kwargs
+        llm._cons_kwargs = lambda messages, **kwargs: cons_kwargs(messages, response_format={"type": "json_object"},
+                                                                  **kwargs)
+    else:
+        return False
+    llm.json_output = True
+    return True
+
 
 class BaseRole(Role):
     """
@@ -36,13 +107,8 @@ class BaseRole(Role):
         self.set_name()
 
     def set_name(self):
-        # set a funky name
-        names = [
-            'Alice', 'Bob', 'Charlie', 'David', 'Eve', 'Frank', 'Grace', 'Thomas',
-            'Hannah', 'Ivy', 'Jack', 'Katie', 'Liam', 'Mia', 'Noah', 'Olivia', 'Zaid',
-            'Parker', 'Quinn', 'Ryan', 'Sophia', 'Tyler', 'Uma', 'Victor', 'Willow',
-        ]
-        setattr(self.__class__, 'name', choice(names))
+        # set a funky name (on the instance, not the class)
+        self.name = random_name()
 
     async def run(self):
         for action in self.actions:
@@ -63,13 +129,160 @@ class BaseRole(Role):
         return msg
 
 
+class BaseAgent:
+    """
+    Lightweight agent without a metagpt Role: the action instances (and their LLM clients) are created
+    once per agent class and shared by all its agents, an agent only holds its own state in slots
+    """
+    __slots__ = ('name',)
+    profile: ClassVar[str] = 'BaseAgent'
+    # action types of the agent, instantiated lazily and shared
+    action_types: ClassVar[tuple[type[Action], ...]] = ()
+    _shared: ClassVar[dict[tuple[type, type], Action]] = dict()
+
+    def __init__(self):
+        self.name = random_name()
+
+    @classmethod
+    def action(cls, index: int) -> Action:
+        """
+        Shared instance of an action of this agent class
+
+        :param index: index in action_types
+        :return: action
+        """
+        key = (cls, cls.action_types[index])
+        if key not in BaseAgent._shared:
+            BaseAgent._shared[key] = cls.action_types[index]().set_prefix(f'You are a {cls.profile}. ')
+        return BaseAgent._shared[key]
+
+    @property
+    def actions(self) -> list[Action]:
+        return [self.action(i) for i in range(len(self.action_types))]
+
+    def __getstate__(self) -> dict:
+        return {slot: getattr(self, slot) for cls in type(self).__mro__ for slot in getattr(cls, '__slots__', ())
+                if hasattr(self, slot)}
+
+    def __setstate__(self, state: dict) -> None:
+        if '__dict__' in state:
+            # pickled while the agent was still a metagpt role
+            state = self._upgrade(state['__dict__'])
+        for slot, value in state.items():
+            setattr(self, slot, value)
+
+    def _upgrade(self, fields: dict) -> dict:
+        """
+        State of the agent from the fields of a pickled metagpt role
+
+        :param fields: fields of the role
+        :return: state
+        """
+        return {"name": fields.get('name') or random_name()}
+
+
+class PromptTemplate:
+    """
+    Prompt template in str.format syntax with named fields only, parsed once instead of on every format
+    """
+    __slots__ = ('template', 'parts', 'fields')
+
+    def __init__(self, template: str):
+        """
+        Constructor for PromptTemplate class
+
+        :param template: template, e.g. 'Answer the prompt {prompt}'
+        """
+        self.template = template
+        # (literal text, field name or None)
+        self.parts: list[tuple[str, str | None]] = list()
+        for literal, field, spec, conversion in Formatter().parse(template):
+            if field is not None and (not field.isidentifier() or spec or conversion):
+                raise ValueError(f'Unsupported field \'{{{field}}}\' in prompt template, use {{name}} only')
+            self.parts.append((literal, field))
+        self.fields: set[str] = {field for _, field in self.parts if field is not None}
+
+    def format(self, **values) -> str:
+        """
+        Fill in the template
+
+        :param values: values of the fields
+        :return: prompt
+        """
+        return ''.join(literal + (str(values[field]) if field is not None else '') for literal, field in self.parts)
+
+    def __repr__(self):
+        return f'PromptTemplate({self.template!r})'
+
+
 class BaseDynamicAction(Action):
     """
     Base Action class for dynamic action generation
     """
+    # prompt template filled in with the keyword arguments of run
+    prompt_template: ClassVar[PromptTemplate | None] = None
+    # compiled pattern the response is cut down to, None for the whole response
+    output_pattern: ClassVar[re.Pattern | None] = None
+    # opt-in per action type: answer identical prompts from the response cache
+    cache_responses: ClassVar[bool] = False
+    # the output is a JSON object, constrain the model to it where the backend supports that
+    json_output: ClassVar[bool] = False
+
+    async def _aask(self, prompt: str, system_msgs: Optional[list[str]] = None) -> str:
+        with tracing.span('llm.call', action=self.__class__.__name__, prompt_chars=len(prompt)) as span:
+            if not self.cache_responses:
+                rsp = await self.__ask(prompt, system_msgs)
+            else:
+                # answered from the cache unless __ask says otherwise
+                span.set(source='cache')
+                role = '\n'.join([self.prefix, *(system_msgs or [])])
+                # responses of a custom provider (e.g. the mock) never share entries with those of the model
+                model = provider.name if provider is not None else self.llm.model
+                key = cache.responses.key(model, prompt, role, cache.scope.get())
+                rsp = await cache.responses.fetch(key, lambda: self.__ask(prompt, system_msgs))
+            span.set(response_chars=len(rsp))
+        return rsp
+
+    async def __ask(self, prompt: str, system_msgs: Optional[list[str]] = None) -> str:
+        """
+        Send the prompt to the model once the scheduler of its backend grants a slot
+
+        :param prompt: prompt
+        :param system_msgs: additional system messages
+        :return: response of the model
+        """
+        backend = provider.name if provider is not None else self.llm.config.base_url
+        enqueued = time.monotonic()
+        async with scheduler.for_backend(backend).slot(estimate_tokens(prompt)) as slot:
+            tracing.annotate(source='model', queue_wait=time.monotonic() - enqueued)
+            if provider is not None:
+                call = provider.aask(prompt, system_msgs, action=self)
+            else:
+                if self.json_output and settings['parsing']['constrained']:
+                    # the LLM of an action is only shared by the agents of one type, see BaseAgent
+                    constrain_json(self.llm)
+                call = super()._aask(prompt, system_msgs)
+            # the timeout starts with the slot, waiting in the queue of a busy backend doesn't count
+            rsp = await asyncio.wait_for(call, settings['executor']['timeout'])
+            slot.charge(estimate_tokens(rsp))
+        return rsp
+
     async def run(self, **kwargs):
         logger.info(f'Action \'{self.__class__.__name__}\': run with kwargs {kwargs}')
         prompt = self.prompt_template.format(**kwargs)
         rsp = await self._aask(prompt)
         result = type(self).match_pattern(rsp)
         return result
+
+    @classmethod
+    def match_pattern(cls, rsp: str) -> str:
+        """
+        Part of the response matching the output pattern
+
+        :param rsp: response
+        :return: first match, the whole response if there is no pattern or match
+        """
+        if cls.output_pattern is None:
+            return rsp
+        match = cls.output_pattern.search(rsp)
+        return match.group(0) if match else rsp
@@ -0,0 +1,156 @@
+"""
+Tracing of team runs: spans for the phases of a run and for every LLM call.
+
+Finished spans are kept in an in-process ring buffer and, if the opentelemetry API is installed,
+mirrored to the globally configured OpenTelemetry tracer provider.
+"""
+
+import asyncio
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from itertools import count
+from typing import Iterator
+
+from agents import scheduler
+from settings import settings
+
+try:
+    from opentelemetry import trace as otel
+except ImportError:
+    otel = None
+
+_ids = count(1)
+_tracer = otel.get_tracer('lumin') if otel is not None and settings['tracing']['opentelemetry'] else None
+
+# span of the current context
+current: ContextVar['Span | None'] = ContextVar('span', default=None)
+# finished spans, oldest are dropped first
+buffer: deque['Span'] = deque(maxlen=settings['tracing']['buffer'])
+
+
+class Span:
+    """
+    A timed operation, e.g. a phase of a team run or a single LLM call
+    """
+    __slots__ = ('name', 'span_id', 'trace_id', 'parent_id', 'session', 'attributes', 'start', 'end', 'status',
+                 'otel')
+
+    def __init__(self, name: str, parent: 'Span | None', session: str | None, attributes: dict):
+        self.name = name
+        self.span_id = next(_ids)
+        self.trace_id = parent.trace_id if parent else self.span_id
+        self.parent_id = parent.span_id if parent else None
+        self.session = session
+        self.attributes = attributes
+        self.start = time.time()
+        self.end: float | None = None
+        self.status = 'ok'
+        self.otel = None
+
+    @property
+    def duration(self) -> float | None:
+        return self.end - self.start if self.end is not None else None
+
+    def set(self, **attributes) -> None:
+        """
+        Set attributes of the span
+
+        :param attributes: attributes
+        :return: None
+        """
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "trace_id": self.trace_id,
+            "parent_id": self.parent_id,
+            "session": self.session,
+            "start": self.start,
+            "duration": self.duration,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Span]:
+    """
+    Trace the enclosed block as a child of the current span
+
+    :param name: name of the span
+    :param attributes: attributes of the span
+    :return: context manager yielding the span
+    """
+    parent = current.get()
+    s = Span(name, parent, scheduler.session.get(), attributes)
+    if _tracer is not None:
+        context = otel.set_span_in_context(parent.otel) if parent and parent.otel else None
+        s.otel = _tracer.start_span(name, context=context)
+
+    token = current.set(s)
+    try:
+        yield s
+    except asyncio.CancelledError:
+        s.status = 'cancelled'
+        raise
+    except Exception as e:
+        s.status = 'error'
+        s.attributes['error'] = repr(e)
+        raise
+    finally:
+        s.end = time.time()
+        current.reset(token)
+        buffer.append(s)
+        if s.otel is not None:
+            s.otel.set_attributes({'session': s.session or '', 'status': s.status, **s.attributes})
+            if s.status == 'error':
+                s.otel.set_status(otel.Status(otel.StatusCode.ERROR))
+            s.otel.end()
+
+
+def annotate(**attributes) -> None:
+    """
+    Set attributes of the current span (if any)
+
+    :param attributes: attributes
+    :return: None
+    """
+    s = current.get()
+    if s is not None:
+        s.set(**attributes)
+
+
+def recent(session_key: str | None = None, limit: int = 500) -> list[dict]:
+    """
+    Latest finished spans
+
+    :param session_key: only spans of this session
+    :param limit: maximum number of spans
+    :return: spans, oldest first
+    """
+    spans = [s for s in buffer if session_key is None or s.session == session_key]
+    return [s.to_dict() for s in spans[-limit:]]
+
+
+def aggregate(session_key: str | None = None) -> dict:
+    """
+    Call count and durations of the latest finished spans by name (LLM calls also by action)
+
+    :param session_key: only spans of this session
+    :return: stats by span name
+    """
+    groups: dict[str, list[float]] = dict()
+    for s in buffer:
+        if session_key is not None and s.session != session_key:
+            continue
+        name = f'{s.name}:{s.attributes["action"]}' if 'action' in s.attributes else s.name
+        groups.setdefault(name, list()).append(s.duration)
+    return {
+        name: {"count": len(durations), "total": sum(durations), "avg": sum(durations) / len(durations),
+               "max": max(durations)}
+        for name, durations in groups.items()
+    }
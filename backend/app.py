@@ -1,24 +1,96 @@
 import uvicorn
 from fastapi import FastAPI, HTTPException, UploadFile
-from fastapi.responses import RedirectResponse, HTMLResponse
+from fastapi.responses import RedirectResponse, HTMLResponse, StreamingResponse, JSONResponse
 from pydantic import BaseModel
-from configurations import Configuration
-from agents import sessions
+from configurations import Configuration, configurator
+from agents import sessions, streaming, cache, scheduler, tracing, pool, pipelines, mock
+from persistence import database, monitor
 from pathlib import Path
 from argparse import ArgumentParser
 import rag
 import asyncio
+import json
+import os
 
 THIS_DIR = Path(__file__).parent
 
 
 app = FastAPI()
 
+# offline mode for benchmarks: MockLLM options as JSON, see launcher.py --mock
+if os.environ.get('LUMIN_MOCK'):
+    mock_options = json.loads(os.environ['LUMIN_MOCK'])
+    backend_concurrency = mock_options.pop('backend_concurrency', None)
+    mock_llm = mock.install(mock.MockLLM(**mock_options))
+    if backend_concurrency:
+        scheduler.schedulers[mock_llm.name] = scheduler.Scheduler(mock_llm.name, concurrency=backend_concurrency)
+
+
+@app.on_event('startup')
+async def startup():
+    configurator.migrate()
+    sessions.migrate()
+    pool.teams.prewarm()
+    monitor.start()
+
+
+@app.on_event('shutdown')
+async def shutdown():
+    # save the sessions still waiting for the write-behind queue
+    await sessions.writer.close()
+    monitor.stop()
+
+
+@app.exception_handler(sessions.SessionConflict)
+async def session_conflict(request, exc: sessions.SessionConflict):
+    return JSONResponse(status_code=409, content={'detail': str(exc)})
+
+
 @app.get("/status")
 async def status():
     return {"status": "up"}
 
 
+@app.get("/stats")
+async def stats():
+    """
+    Runtime statistics of the server
+
+    :return: stats
+    """
+    return {
+        "cache": cache.responses.stats(),
+        "scheduler": scheduler.stats(),
+        "pool": pool.teams.stats(),
+        "sessions": sessions.stats(),
+        "database": database.stats(),
+        "event_loop": monitor.stats(),
+    }
+
+
+@app.get("/traces")
+async def traces(session_key: str | None = None, limit: int = 500):
+    """
+    Latest tracing spans of team runs and LLM calls
+
+    :param session_key: only spans of this session
+    :param limit: maximum number of spans
+    :return: spans, oldest first
+    """
+    return tracing.recent(session_key, limit)
+
+
+@app.get("/traces/summary")
+async def traces_summary(session_key: str | None = None):
+    """
+    Call count and latency of the latest spans by phase and LLM action
+
+    :param session_key: only spans of this session
+    :return: stats by span name
+    """
+    return tracing.aggregate(session_key)
+
+
 @app.get('/', response_class=HTMLResponse)
 async def root():
     with open(f'{THIS_DIR}/html_templates/landing.html', 'r') as f:
@@ -28,6 +100,7 @@ async def root():
 class WebConfiguration(BaseModel):
     agent_count: int
     supervisor_count: int
+    pipeline: str | None = None
 
 
 @app.post("/cfg/register/")
@@ -38,9 +111,15 @@ async def register_config(configuration: WebConfiguration):
     :param configuration: The configuration to register
     :return: uid of the configuration or error
     """
+    if configuration.pipeline:
+        try:
+            pipelines.load(configuration.pipeline)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     try:
-        cfg = Configuration(agent_count=configuration.agent_count, supervisor_count=configuration.supervisor_count)
-        cfg.save()
+        cfg = Configuration(agent_count=configuration.agent_count, supervisor_count=configuration.supervisor_count,
+                            pipeline=configuration.pipeline)
+        await cfg.asave()
         return {"uid": cfg.uid}
     except Exception as e:
         raise HTTPException(status_code=500, detail=e)
@@ -54,42 +133,57 @@ async def pluck_config(uid: int):
     :param uid: uid of the configuration
     :return: the configuration if found else 404
     """
-    cfg = Configuration.grab(uid)
+    cfg = await Configuration.agrab(uid)
     if not cfg:
         raise HTTPException(status_code=404, detail="Configuration not found")
     return {
         "agent_count": cfg.agent_count,
         "supervisor_count": cfg.supervisor_count,
         "uid": cfg.uid,
+        "pipeline": cfg.pipeline,
     }
 
 
+@app.get("/pipelines")
+async def list_pipelines():
+    """
+    List all team pipelines that can be selected in a configuration
+
+    :return: pipeline names and descriptions
+    """
+    return {name: pipelines.load(name).spec.description for name in pipelines.available()}
+
+
 @app.post("/session/create")
-async def create_session(config_uid: int):
+async def create_session(config_uid: int, session_key: str | None = None):
     """
     Create a new session
 
     :param config_uid: UID of the configuration which should be used for the session
+    :param session_key: key for the session (set by the router of launcher.py), random if not given
     :return: session key
     """
-    session = sessions.Session(config_uid)
-    session.save()
+    try:
+        session = await sessions.Session.acreate(config_uid, session_key)
+    except sessions.SessionConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
     sessions.Cache.add(session)
     return {'session_key': session.key}
 
 
 @app.post("/session/read")
-async def read_session(session_key: str):
+async def read_session(session_key: str, since: int = 0):
     """
     Reopen a previous session (read conversation data)
 
     :param session_key: session key
+    :param since: number of messages the client already has, only the messages after them are returned
     :return: list of messages
     """
-    session = sessions.Cache.locate(session_key)
+    session = await sessions.Cache.alocate(session_key)
     if not session:
         return HTTPException(status_code=400, detail='session not found')
-    return await session.history()
+    return await session.history(max(since, 0))
 
 
 @app.post("/session/send")
@@ -101,7 +195,8 @@ async def send_session(session_key: str, prompt: str):
     :param prompt: message
     :return: response from session team
     """
-    session = sessions.Cache.locate(session_key)
+    scheduler.enter(scheduler.INTERACTIVE, session_key)
+    session = await sessions.Cache.alocate(session_key)
     if not session:
         return HTTPException(status_code=400, detail="session not found")
     return await session.send(prompt)
@@ -116,7 +211,8 @@ async def send_with_context(session_key: str, prompt: str):
     :param prompt: message
     :return: response from session team
     """
-    session = sessions.Cache.locate(session_key)
+    scheduler.enter(scheduler.INTERACTIVE, session_key)
+    session = await sessions.Cache.alocate(session_key)
     if not session:
         return HTTPException(status_code=400, detail="session not found")
     context = rag.query_docs(prompt)
@@ -125,6 +221,44 @@ async def send_with_context(session_key: str, prompt: str):
     return await session.send(prompt)
 
 
+@app.post("/session/send-stream")
+async def send_session_stream(session_key: str, prompt: str):
+    """
+    Send a message to team in a session and stream the progress as Server-Sent Events:
+    phase events (generating, judging, iteration, voting), the draft tokens of the first agent
+    and finally the response (final)
+
+    :param session_key: session key
+    :param prompt: message
+    :return: event stream
+    """
+    scheduler.enter(scheduler.INTERACTIVE, session_key)
+    session = await sessions.Cache.alocate(session_key)
+    if not session:
+        raise HTTPException(status_code=400, detail="session not found")
+    events = session.send_stream(prompt)
+    return StreamingResponse((streaming.sse(event) async for event in events), media_type='text/event-stream')
+
+
+@app.post('/session/send-with-context-stream')
+async def send_with_context_stream(session_key: str, prompt: str):
+    """
+    Streaming variant of /session/send-with-context, see /session/send-stream
+
+    :param session_key: session key
+    :param prompt: message
+    :return: event stream
+    """
+    scheduler.enter(scheduler.INTERACTIVE, session_key)
+    session = await sessions.Cache.alocate(session_key)
+    if not session:
+        raise HTTPException(status_code=400, detail="session not found")
+    context = rag.query_docs(prompt)
+    prompt = f'{prompt}\n\nIf relevant, use the following context:\n{context}'
+    events = session.send_stream(prompt)
+    return StreamingResponse((streaming.sse(event) async for event in events), media_type='text/event-stream')
+
+
 @app.post('/nosession/send-with-context')
 async def nosession_with_context(prompt: str):
     """
@@ -133,10 +267,11 @@ async def nosession_with_context(prompt: str):
     :param prompt: message
     :return: response from team
     """
+    scheduler.enter(scheduler.STATELESS)
     context = rag.query_docs(prompt)
     prompt = f'{prompt}\n\nIf relevant, use the following context:\n{context}'
-    team = sessions.Team(agents=[sessions.ChatRole(), sessions.ChatRole()], supervisors=[sessions.SupervisorRole()])
-    return await team(prompt)
+    async with pool.teams.team(agents=2, supervisors=1) as team:
+        return await team(prompt)
 
 
 @app.post("/nosession/send")
@@ -147,8 +282,9 @@ async def send_nosession(prompt: str):
     :param prompt: message
     :return: response from team
     """
-    team = sessions.Team(agents=[sessions.ChatRole(), sessions.ChatRole()], supervisors=[sessions.SupervisorRole()])
-    return await team(prompt)
+    scheduler.enter(scheduler.STATELESS)
+    async with pool.teams.team(agents=2, supervisors=1) as team:
+        return await team(prompt)
 
 
 @app.get("/cfg/{uid}")
@@ -170,13 +306,9 @@ async def open_session(session_key: str):
     :param session_key: session key
     :return: session details
     """
-    if not sessions.Cache.check(session_key):
-        session = sessions.Session.find(session_key)
-        if not session:
-            return HTTPException(status_code=404, detail="Configuration not found")
-        sessions.Cache.add(session)
-    else:
-        session = sessions.Cache.find(session_key)
+    session = await sessions.Cache.alocate(session_key)
+    if not session:
+        return HTTPException(status_code=404, detail="Configuration not found")
 
     cfg = session.config
     return {
@@ -188,13 +320,22 @@ async def open_session(session_key: str):
 
 
 @app.get("/session/list")
-async def list_sessions():
+async def list_sessions(limit: int | None = None, after: int | None = None):
     """
-    Retrieve list of all session keys
+    Retrieve list of all session keys, or a page of them if limit or after is given
 
-    :return: session keys
+    :param limit: maximum number of session keys per page (at most 1000)
+    :param after: cursor returned with the previous page
+    :return: session keys, or a page: {"sessions": session keys, "after": cursor for the next page}
     """
-    return sessions.Session.list()
+    if limit is None and after is None:
+        return await sessions.Session.alist()
+    page = await sessions.Session.apage(min(max(limit or 1000, 1), 1000), after)
+    return {
+        "sessions": [session_key for _, session_key in page],
+        # uid of the last session, sessions created later follow it
+        "after": page[-1][0] if page else after,
+    }
 
 
 @app.post("/cfg/list")
@@ -204,7 +345,7 @@ async def list_configs():
 
     :return: list of configuration uids
     """
-    return Configuration.list()
+    return await database.run(Configuration.list)
 
 
 @app.put('/ingest')
@@ -0,0 +1,275 @@
+"""
+Throughput benchmark for teams and sessions against the offline mock LLM (no network needed).
+"""
+
+import asyncio
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from itertools import product
+from pathlib import Path
+
+import httpx
+
+from metagpt.logs import logger
+from rich import print
+from rich.table import Table
+
+# sessions and configurations created by the benchmark go to temporary databases, set before agents is imported
+_databases = tempfile.TemporaryDirectory(prefix='lumin-benchmark-')
+os.environ['LUMIN_SESSIONS_DB'] = str(Path(_databases.name) / 'sessions.sqlite')
+os.environ['LUMIN_CONFIGURATIONS_DB'] = str(Path(_databases.name) / 'database.sqlite')
+
+from agents import Team, ChatRole, SupervisorRole, mock, cache, scheduler, pool
+
+
+def percentile(values: list[float], p: float) -> float:
+    """
+    Percentile of a list of values
+
+    :param values: values
+    :param p: percentile in [0, 1]
+    :return: percentile
+    """
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)] if values else 0.0
+
+
+async def bench(agents: int, supervisors: int, concurrency: int, requests: int, mode: str, llm: mock.MockLLM,
+                race: bool = False, batch_judge: bool = False) -> dict:
+    """
+    Send requests with the given concurrency and measure latency and throughput
+
+    :param agents: agents per team
+    :param supervisors: supervisors per team
+    :param concurrency: requests in flight at the same time
+    :param requests: number of requests
+    :param mode: 'team' for a fresh team per request, 'pool' for pooled teams (like /nosession),
+                 'session' for Session.send
+    :param llm: installed mock LLM
+    :param race: race mode of the teams
+    :param batch_judge: batched judging of the teams
+    :return: results
+    """
+    from agents import sessions
+    from configurations import Configuration, configurator
+
+    llm.calls.clear()
+    cache.responses.clear()
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = list()
+    created: list = list()
+
+    cfg = None
+    if mode == 'session':
+        configurator.migrate()
+        sessions.migrate()
+        cfg = Configuration(agent_count=agents, supervisor_count=supervisors)
+        cfg.save()
+
+    async def request(i: int) -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            if mode == 'session':
+                session = sessions.Session(cfg.uid)
+                session.team.race, session.team.batch_judge = race, batch_judge
+                created.append(session)
+                await session.send(f'Prompt number {i}')
+            elif mode == 'pool':
+                async with pool.teams.team(agents, supervisors) as team:
+                    team.race, team.batch_judge = race, batch_judge
+                    await team(f'Prompt number {i}')
+            else:
+                team = Team([ChatRole() for _ in range(agents)], [SupervisorRole() for _ in range(supervisors)],
+                            race=race, batch_judge=batch_judge)
+                await team(f'Prompt number {i}')
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(request(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+
+    # clean up the database
+    for session in created:
+        session.delete()
+    if cfg is not None:
+        cfg.delete()
+
+    calls = sum(llm.calls.values())
+    return {
+        "throughput": requests / elapsed,
+        "p50": percentile(latencies, 0.5),
+        "p99": percentile(latencies, 0.99),
+        "calls": calls / requests,
+        "by_action": {name: count / requests for name, count in llm.calls.items()},
+    }
+
+
+async def bench_http(workers: int, agents: int, supervisors: int, concurrency: int, requests: int, args) -> dict:
+    """
+    Start the server with launcher.py (workers with the mock LLM) and send session requests over HTTP
+
+    :param workers: number of worker processes
+    :param agents: agents per team
+    :param supervisors: supervisors per team
+    :param concurrency: requests in flight at the same time
+    :param requests: number of requests (each creates a session and sends a message)
+    :param args: command line arguments (mock options)
+    :return: results
+    """
+    options = {'latency': args.latency, 'latency_mean': args.latency_mean, 'latency_spread': args.latency_spread,
+               'tokens_per_second': args.tokens_per_second, 'answer_tokens': args.answer_tokens,
+               'approve': args.approve, 'messy': args.messy, 'seed': args.seed,
+               'backend_concurrency': args.backend_concurrency}
+    port = args.port
+    # the sessions and configurations created here go to temporary databases, not the ones of the server
+    databases = tempfile.TemporaryDirectory(prefix='lumin-benchmark-')
+    env = dict(os.environ,
+               LUMIN_SESSIONS_DB=str(Path(databases.name) / 'sessions.sqlite'),
+               LUMIN_CONFIGURATIONS_DB=str(Path(databases.name) / 'database.sqlite'))
+    launcher = subprocess.Popen(
+        [sys.executable, 'launcher.py', '--workers', str(workers), '--port', str(port), '--host', '127.0.0.1',
+         '--worker-port', str(port + 1), '--app', args.app, '--mock', json.dumps(options)],
+        cwd=Path(__file__).parent, stdout=subprocess.DEVNULL, env=env,
+    )
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = list()
+    try:
+        async with httpx.AsyncClient(base_url=f'http://127.0.0.1:{port}', timeout=None) as client:
+            while True:
+                if launcher.poll() is not None:
+                    raise RuntimeError(f'launcher exited with code {launcher.returncode}')
+                try:
+                    if (await client.get('/status')).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.2)
+
+            response = await client.post('/cfg/register/', json={'agent_count': agents, 'supervisor_count': supervisors})
+            config_uid = response.json()['uid']
+
+            async def request(i: int) -> None:
+                async with semaphore:
+                    start = time.perf_counter()
+                    response = await client.post('/session/create', params={'config_uid': config_uid})
+                    session_key = response.json()['session_key']
+                    response = await client.post('/session/send',
+                                                 params={'session_key': session_key, 'prompt': f'Prompt number {i}'})
+                    response.raise_for_status()
+                    latencies.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            await asyncio.gather(*(request(i) for i in range(requests)))
+            elapsed = time.perf_counter() - start
+            routed = (await client.get('/launcher/stats')).json()
+    finally:
+        launcher.terminate()
+        launcher.wait()
+        databases.cleanup()
+
+    return {
+        "throughput": requests / elapsed,
+        "p50": percentile(latencies, 0.5),
+        "p99": percentile(latencies, 0.99),
+        "routed": [worker['requests'] for worker in routed['workers']],
+    }
+
+
+async def main_http(args) -> None:
+    table = Table(title=f'Lumin benchmark (http, {args.requests} requests per row)')
+    for column in ('workers', 'agents', 'supervisors', 'concurrency', 'req/s', 'speedup', 'p50 [s]', 'p99 [s]',
+                   'requests by worker'):
+        table.add_column(column)
+
+    for agents, supervisors, concurrency in product(args.agents, args.supervisors, args.concurrency):
+        baseline = None
+        for workers in args.workers:
+            result = await bench_http(workers, agents, supervisors, concurrency, args.requests, args)
+            baseline = baseline or result['throughput']
+            table.add_row(str(workers), str(agents), str(supervisors), str(concurrency),
+                          f'{result["throughput"]:.2f}', f'{result["throughput"] / baseline:.2f}x',
+                          f'{result["p50"]:.2f}', f'{result["p99"]:.2f}', ', '.join(map(str, result['routed'])))
+            print(f'[green]done: workers={workers} agents={agents} supervisors={supervisors} '
+                  f'concurrency={concurrency}[/]')
+
+    print(table)
+
+
+async def main(args) -> None:
+    if args.mode == 'http':
+        return await main_http(args)
+
+    llm = mock.install(mock.MockLLM(latency=args.latency, latency_mean=args.latency_mean,
+                                    latency_spread=args.latency_spread, tokens_per_second=args.tokens_per_second,
+                                    answer_tokens=args.answer_tokens, approve=args.approve, messy=args.messy,
+                                    seed=args.seed))
+    # capacity of the (fake) model server
+    scheduler.schedulers[llm.name] = scheduler.Scheduler(llm.name, concurrency=args.backend_concurrency)
+
+    table = Table(title=f'Lumin benchmark ({args.mode}, {args.requests} requests per row)')
+    for column in ('agents', 'supervisors', 'concurrency', 'req/s', 'p50 [s]', 'p99 [s]', 'LLM calls/req',
+                   'calls by action/req'):
+        table.add_column(column)
+
+    for agents, supervisors, concurrency in product(args.agents, args.supervisors, args.concurrency):
+        # the team prints its progress, keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = await bench(agents, supervisors, concurrency, args.requests, args.mode, llm,
+                                 race=args.race, batch_judge=args.batch_judge)
+        table.add_row(str(agents), str(supervisors), str(concurrency), f'{result["throughput"]:.2f}',
+                      f'{result["p50"]:.2f}', f'{result["p99"]:.2f}', f'{result["calls"]:.1f}',
+                      ', '.join(f'{name}={count:.1f}' for name, count in sorted(result['by_action'].items())))
+        print(f'[green]done: agents={agents} supervisors={supervisors} concurrency={concurrency}[/]')
+
+    print(table)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(
+        prog='Lumin',
+        description='Lumin orchestration benchmark using a mock LLM',
+    )
+
+    def ints(value: str) -> list[int]:
+        return [int(v) for v in value.split(',')]
+
+    parser.add_argument('--mode', choices=('team', 'pool', 'session', 'http'), default='team',
+                        help='fresh team per request, pooled teams (like /nosession), Session.send '
+                             'or sessions over HTTP against launcher.py')
+    parser.add_argument('--agents', type=ints, default=[1, 3, 5], help='comma separated agent counts')
+    parser.add_argument('--supervisors', type=ints, default=[1, 2], help='comma separated supervisor counts')
+    parser.add_argument('--concurrency', type=ints, default=[1, 8], help='comma separated request concurrencies')
+    parser.add_argument('--requests', type=int, default=16, help='requests per configuration')
+    parser.add_argument('--workers', type=ints, default=[1, 2, 4],
+                        help='comma separated worker counts (http mode)')
+    parser.add_argument('--port', type=int, default=3900, help='port of the router, workers use the following ports '
+                                                               '(http mode)')
+    parser.add_argument('--app', default='app:app', help='ASGI app of the workers (http mode)')
+    parser.add_argument('--race', action='store_true', help='use race mode')
+    parser.add_argument('--batch-judge', action='store_true', dest='batch_judge', help='use batched judging')
+    parser.add_argument('--backend-concurrency', type=int, default=16, dest='backend_concurrency',
+                        help='LLM calls the mock backend serves at the same time (per worker in http mode)')
+    parser.add_argument('--latency', choices=('constant', 'uniform', 'exponential', 'lognormal'),
+                        default='lognormal', help='latency distribution of the mock LLM')
+    parser.add_argument('--latency-mean', type=float, default=0.2, dest='latency_mean')
+    parser.add_argument('--latency-spread', type=float, default=0.5, dest='latency_spread')
+    parser.add_argument('--tokens-per-second', type=float, default=200, dest='tokens_per_second')
+    parser.add_argument('--answer-tokens', type=int, default=40, dest='answer_tokens')
+    parser.add_argument('--approve', type=float, default=0.7, help='probability that a supervisor approves')
+    parser.add_argument('--messy', type=float, default=0.0,
+                        help='probability that unconstrained JSON output is wrapped in prose')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--debug', action='store_true', help='Enable debug mode')
+    args = parser.parse_args()
+
+    if not args.debug:
+        logger.remove()
+
+    asyncio.run(main(args))
@@ -2,9 +2,13 @@ import sqlalchemy as sql
 from sqlalchemy import Table, Column, Integer, String, MetaData
 from typing import Any
 from pathlib import Path
+import os
+from migrations import add_missing_columns
+from persistence import database
 
 THIS_DIR = Path(__file__).parent
-SQLALCHEMY_DATABASE_URL = f"sqlite:///{THIS_DIR}/database.sqlite"
+# LUMIN_CONFIGURATIONS_DB: other database file, e.g. a temporary one for benchmarks
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{os.environ.get('LUMIN_CONFIGURATIONS_DB', THIS_DIR / 'database.sqlite')}"
 
 engine = sql.create_engine(SQLALCHEMY_DATABASE_URL)
 metadata = MetaData()
@@ -16,6 +20,7 @@ tables = {
         Column("uid", Integer, primary_key=True),
         Column("agent_count", Integer),
         Column("supervisor_count", Integer),
+        Column("pipeline", String, nullable=True),
         extend_existing=True,
     ),
     "datasources": Table(
@@ -27,8 +32,19 @@ tables = {
     ),
 }
 
-# create tables if not exist
-metadata.create_all(bind=engine)
+
+
+def migrate() -> None:
+    """
+    Create missing tables and columns in the configurations database.
+    Called once at startup (see app.py), not at import, so importing this module never writes to the database.
+
+    :return: None
+    """
+    metadata.create_all(bind=engine)
+    for table in tables.values():
+        add_missing_columns(engine, table)
+
 
 
 class Configuration:
@@ -36,10 +52,12 @@ class Configuration:
     A class to represent a LLM configuration in the database
     """
 
-    def __init__(self, agent_count: int, supervisor_count: int, uid: int = None):
+    def __init__(self, agent_count: int, supervisor_count: int, uid: int = None, pipeline: str | None = None):
         self.uid = uid
         self.agent_count = agent_count
         self.supervisor_count = supervisor_count
+        # name of the team pipeline (see agents/pipelines.py), None for the default team
+        self.pipeline = pipeline
         self._datasources = None
 
     @staticmethod
@@ -55,13 +73,32 @@ class Configuration:
         # search in database
         with engine.connect() as conn:
             result = conn.execute(
-                sql.select(cfg_table.c.agent_count, cfg_table.c.supervisor_count).where(cfg_table.c.uid == uid)
+                sql.select(cfg_table.c.agent_count, cfg_table.c.supervisor_count, cfg_table.c.pipeline)
+                .where(cfg_table.c.uid == uid)
             )
             row = result.first()
             if row:
-                return Configuration(agent_count=row[0], supervisor_count=row[1], uid=uid)
+                return Configuration(agent_count=row[0], supervisor_count=row[1], uid=uid, pipeline=row[2])
         return None
 
+    @staticmethod
+    async def agrab(uid: int) -> Any | None:
+        """
+        Grabs the configuration from the database on the database thread pool, see grab
+
+        :param uid: uid of the configuration in the database
+        :return: Configuration object or None if not found
+        """
+        return await database.run(Configuration.grab, uid)
+
+    async def asave(self) -> None:
+        """
+        Save configuration on the database thread pool, see save
+
+        :return: None
+        """
+        await database.run(self.save)
+
     def save(self) -> None:
         """
         Save configuration to file:
@@ -81,6 +118,7 @@ class Configuration:
                         uid=self.uid,
                         agent_count=self.agent_count,
                         supervisor_count=self.supervisor_count,
+                        pipeline=self.pipeline,
                     )
                 )
                 self.uid = rows.inserted_primary_key[0]
@@ -90,6 +128,7 @@ class Configuration:
                     cfg_table.update().where(cfg_table.c.uid == self.uid).values(
                         agent_count=self.agent_count,
                         supervisor_count=self.supervisor_count,
+                        pipeline=self.pipeline,
                     )
                 )
             conn.commit()
@@ -199,7 +238,8 @@ class Configuration:
             return [row[0] for row in result]
 
     def __repr__(self):
-        return f"Configuration(agent_count={self.agent_count}, supervisor_count={self.supervisor_count}, uid={self.uid})"
+        return f"Configuration(agent_count={self.agent_count}, supervisor_count={self.supervisor_count}, " \
+               f"uid={self.uid}, pipeline={self.pipeline!r})"
 
 
 if __name__ == '__main__':
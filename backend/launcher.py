@@ -0,0 +1,218 @@
+"""
+Multi-process deployment of the Lumin API server: N worker processes (uvicorn, one core each)
+behind a router on the public port.
+
+Requests with a session key always go to the same worker (crc32 of the key), so the session cache
+of each worker stays authoritative for its sessions. The router chooses the key of new sessions
+to route /session/create accordingly. Stateless requests (/nosession/*, configurations, ...)
+go to the worker with the fewest requests in flight.
+
+    python launcher.py --workers 4 --port 3000
+
+The workers share the SQLite databases, see agents/sessions.py for the version check on saves,
+and the Weaviate instance of the documents (rag.host in config/lumin.yaml), an embedded instance can't be shared.
+Router stats: GET /launcher/stats
+"""
+
+import os
+import signal
+import subprocess
+import sys
+import time
+import zlib
+from argparse import ArgumentParser
+from pathlib import Path
+from uuid import uuid4
+
+import httpx
+import uvicorn
+from rich import print
+from settings import settings
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+THIS_DIR = Path(__file__).parent
+
+# hop-by-hop headers, not forwarded
+HOP_HEADERS = {'connection', 'keep-alive', 'transfer-encoding', 'upgrade', 'host'}
+# set again by the client for the forwarded body
+REQUEST_HEADERS_SKIPPED = HOP_HEADERS | {'content-length'}
+
+
+class Router:
+    """
+    Reverse proxy in front of the workers with session affinity
+    """
+
+    def __init__(self, upstreams: list[str]):
+        """
+        Constructor for Router class
+
+        :param upstreams: base URLs of the workers
+        """
+        self.upstreams = upstreams
+        self.client = httpx.AsyncClient(timeout=None, limits=httpx.Limits(max_connections=None))
+        # stats
+        self.inflight = [0] * len(upstreams)
+        self.requests = [0] * len(upstreams)
+        self.errors = 0
+        self.app = Starlette(routes=[
+            Route('/launcher/stats', self.stats, methods=['GET']),
+            Route('/{path:path}', self.proxy, methods=['GET', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS', 'HEAD']),
+        ], on_shutdown=[self.client.aclose])
+
+    def worker(self, session_key: str | None) -> int:
+        """
+        Worker for a request
+
+        :param session_key: session key of the request, None for stateless requests
+        :return: index of the worker
+        """
+        if session_key:
+            return zlib.crc32(session_key.encode()) % len(self.upstreams)
+        return min(range(len(self.upstreams)), key=self.inflight.__getitem__)
+
+    async def proxy(self, request: Request) -> Response:
+        """
+        Forward a request to its worker, the response is streamed back
+
+        :param request: request
+        :return: response of the worker
+        """
+        params = dict(request.query_params)
+        if request.url.path.rstrip('/') == '/session/create' and not params.get('session_key'):
+            # choose the key here, so the session is created on the worker that will serve it
+            params['session_key'] = str(uuid4())
+        index = self.worker(params.get('session_key'))
+
+        upstream = self.client.build_request(
+            request.method,
+            self.upstreams[index] + request.url.path,
+            params=params,
+            headers=[(k, v) for k, v in request.headers.items() if k.lower() not in REQUEST_HEADERS_SKIPPED],
+            content=await request.body(),
+        )
+        self.inflight[index] += 1
+        self.requests[index] += 1
+        try:
+            response = await self.client.send(upstream, stream=True)
+        except httpx.TransportError as e:
+            self.inflight[index] -= 1
+            self.errors += 1
+            print(f'[bold red]worker {index} unreachable: {e!r}[/]')
+            return JSONResponse({'detail': f'worker {index} unreachable'}, status_code=502)
+
+        async def body():
+            try:
+                async for chunk in response.aiter_raw():
+                    yield chunk
+            finally:
+                await response.aclose()
+                self.inflight[index] -= 1
+
+        headers = {k: v for k, v in response.headers.items() if k.lower() not in HOP_HEADERS}
+        return StreamingResponse(body(), status_code=response.status_code, headers=headers)
+
+    async def stats(self, request: Request) -> Response:
+        return JSONResponse({
+            'workers': [
+                {'upstream': upstream, 'requests': requests, 'inflight': inflight}
+                for upstream, requests, inflight in zip(self.upstreams, self.requests, self.inflight)
+            ],
+            'errors': self.errors,
+        })
+
+
+def spawn(app: str, port: int, env: dict) -> subprocess.Popen:
+    """
+    Start a worker process
+
+    :param app: ASGI app of the worker, module:attribute
+    :param port: port of the worker (bound to localhost)
+    :param env: environment of the worker
+    :return: process
+    """
+    return subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', app, '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning'],
+        cwd=THIS_DIR, env=env,
+    )
+
+
+def wait_ready(upstreams: list[str], processes: list[subprocess.Popen], timeout: float = 120) -> None:
+    """
+    Wait until all workers answer /status
+
+    :param upstreams: base URLs of the workers
+    :param processes: worker processes
+    :param timeout: seconds to wait at most
+    :return: None
+    """
+    deadline = time.monotonic() + timeout
+    for upstream, process in zip(upstreams, processes):
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f'worker {upstream} exited with code {process.returncode}')
+            try:
+                if httpx.get(f'{upstream}/status', timeout=1).status_code == 200:
+                    break
+            except httpx.TransportError:
+                pass
+            if time.monotonic() > deadline:
+                raise TimeoutError(f'worker {upstream} not ready after {timeout}s')
+            time.sleep(0.2)
+
+
+def stop(signum, frame):
+    # uvicorn raises the signal again after shutting the router down, exit through the cleanup of main
+    raise SystemExit(128 + signum)
+
+
+def main(args) -> None:
+    signal.signal(signal.SIGTERM, stop)
+    ports = [args.worker_port + i for i in range(args.workers)]
+    upstreams = [f'http://127.0.0.1:{port}' for port in ports]
+    env = dict(os.environ, LUMIN_WORKERS=str(args.workers))
+    if args.mock:
+        env['LUMIN_MOCK'] = args.mock
+
+    # the first worker migrates the databases at startup, the others start once it is done
+    processes = [spawn(args.app, ports[0], env)]
+    try:
+        wait_ready(upstreams[:1], processes)
+        processes += [spawn(args.app, port, env) for port in ports[1:]]
+        wait_ready(upstreams, processes)
+        print(f'[bold green]Starting Lumin router with {args.workers} workers on port {args.port}[/]')
+        uvicorn.run(Router(upstreams).app, host=args.host, port=args.port, log_level=args.log_level)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                # workers save their pending sessions on shutdown
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(
+        prog='Lumin',
+        description='Lumin API server with multiple worker processes',
+    )
+    parser.add_argument('-w', '--workers', default=os.cpu_count() or 1, type=int, help='number of worker processes')
+    parser.add_argument('-p', '--port', default=3000, type=int, help='port of the router')
+    parser.add_argument('--host', default='0.0.0.0', help='host of the router')
+    parser.add_argument('--worker-port', default=3100, type=int, dest='worker_port',
+                        help='port of the first worker, the others follow')
+    parser.add_argument('--app', default='app:app', help='ASGI app of the workers')
+    parser.add_argument('--mock', default=None,
+                        help='MockLLM options as JSON (e.g. \'{"latency_mean": 0.2}\') to run offline, for benchmarks')
+    parser.add_argument('--log-level', default='warning', dest='log_level')
+    args = parser.parse_args()
+    if args.workers > 1 and not settings['rag']['host'] and not args.mock:
+        # every worker would start its own embedded Weaviate with its own documents
+        parser.error('multiple workers need a shared Weaviate instance, set rag.host in config/lumin.yaml')
+
+    main(args)
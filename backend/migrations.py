@@ -0,0 +1,43 @@
+"""
+Schema migrations for the SQLite databases: metadata.create_all creates missing tables but doesn't touch
+existing ones, so columns and indexes added to a table definition later are added here.
+"""
+
+import sqlalchemy as sql
+from sqlalchemy import Table
+from sqlalchemy.engine import Engine
+
+
+def add_missing_columns(engine: Engine, table: Table) -> list[str]:
+    """
+    Add the columns of the table definition that are missing in the database.
+    New columns must be nullable (or have a server default), existing rows get NULL.
+
+    :param engine: engine of the database
+    :param table: table definition
+    :return: names of the added columns
+    """
+    existing = {column['name'] for column in sql.inspect(engine).get_columns(table.name)}
+    added: list[str] = list()
+    with engine.connect() as conn:
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=engine.dialect)
+            conn.execute(sql.text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+            added.append(column.name)
+        conn.commit()
+    return added
+
+
+def add_missing_indexes(engine: Engine, table: Table) -> None:
+    """
+    Create the indexes of the table definition that are missing in the database
+    (metadata.create_all only creates them together with a new table)
+
+    :param engine: engine of the database
+    :param table: table definition
+    :return: None
+    """
+    for index in table.indexes:
+        index.create(bind=engine, checkfirst=True)
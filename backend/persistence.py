@@ -0,0 +1,147 @@
+"""
+Database work off the event loop: SQLite (and unpickling) is blocking, so sessions and configurations
+are loaded and saved on a dedicated thread pool, request handlers only await the results.
+The event loop monitor measures how long the loop was blocked anyway.
+"""
+
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from settings import settings
+
+
+class DatabaseExecutor:
+    """
+    Thread pool for blocking database calls. The number of calls waiting for a thread is bounded,
+    callers beyond that wait (without blocking the event loop) until a call finished.
+    """
+
+    def __init__(self, workers: int = 4, queue: int = 64):
+        """
+        Constructor for DatabaseExecutor class
+
+        :param workers: number of threads
+        :param queue: maximum number of calls waiting for a thread
+        """
+        self.workers = workers
+        self.queue = queue
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='database')
+        self._slots = asyncio.Semaphore(workers + queue)
+        # stats
+        self.calls = 0
+        self.errors = 0
+        self.pending = 0
+        self.busy = 0.0
+        self.waited = 0.0
+        self.max_wait = 0.0
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Run a blocking call on the pool
+
+        :param fn: function to call
+        :param args: positional arguments
+        :param kwargs: keyword arguments
+        :return: result of the call
+        """
+        self.pending += 1
+        try:
+            async with self._slots:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._pool, functools.partial(
+                    self.__timed, fn, time.monotonic(), args, kwargs))
+        finally:
+            self.pending -= 1
+
+    def __timed(self, fn: Callable, queued: float, args: tuple, kwargs: dict) -> Any:
+        start = time.monotonic()
+        wait = start - queued
+        self.calls += 1
+        self.waited += wait
+        self.max_wait = max(self.max_wait, wait)
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.busy += time.monotonic() - start
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queue": self.queue,
+            "pending": self.pending,
+            "calls": self.calls,
+            "errors": self.errors,
+            "busy": self.busy,
+            "mean_wait": self.waited / self.calls if self.calls else 0.0,
+            "max_wait": self.max_wait,
+        }
+
+
+class LoopMonitor:
+    """
+    Measures the lag of the event loop: a task sleeps for a fixed interval,
+    any time it wakes up late the loop was busy (or blocked) with something else
+    """
+
+    def __init__(self, interval: float = 0.1, threshold: float = 0.02):
+        """
+        Constructor for LoopMonitor class
+
+        :param interval: seconds between measurements
+        :param threshold: lag in seconds that counts as blocked
+        """
+        self.interval = interval
+        self.threshold = threshold
+        self._task: asyncio.Task | None = None
+        # stats
+        self.samples = 0
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.stalls = 0
+        self.blocked = 0.0
+
+    def start(self) -> None:
+        """
+        Start measuring on the running event loop
+
+        :return: None
+        """
+        if not self._task or self._task.done():
+            self._task = asyncio.create_task(self.__run())
+
+    def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+
+    async def __run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            self.samples += 1
+            self.lag += lag
+            self.max_lag = max(self.max_lag, lag)
+            if lag > self.threshold:
+                self.stalls += 1
+                self.blocked += lag
+
+    def stats(self) -> dict:
+        return {
+            "samples": self.samples,
+            "mean_lag": self.lag / self.samples if self.samples else 0.0,
+            "max_lag": self.max_lag,
+            "stalls": self.stalls,
+            "blocked": self.blocked,
+        }
+
+
+# shared by the sessions and configurations of this process
+database = DatabaseExecutor(**settings['database'])
+monitor = LoopMonitor(**settings['event_loop'])
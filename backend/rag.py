@@ -4,28 +4,51 @@ import weaviate.classes as wvc
 from weaviate.classes.config import Property, DataType
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 import pymupdf
+import os
 from pathlib import Path
+from settings import settings
 
 THIS_DIR = Path(__file__).parent
 
 # Initialize the ollama client
 ollama_client = ollama.Client("https://7e28-188-241-30-201.ngrok-free.app/api")
 
-# Initialize the weaviate client
-client = weaviate.connect_to_embedded()
+# weaviate client and collection, connected on first use
+client = None
+_collection = None
 
-# collection
-collection_name = "docs"
 
-if client.collections.exists(collection_name):
-    client.collections.delete(collection_name)
+def connect():
+    """
+    Connect to Weaviate and create the collection if missing. All worker processes of launcher.py share the
+    instance configured in the settings (rag.host), an embedded instance only works with a single process.
 
-collection = client.collections.create(
-    collection_name,
-    properties=[
-        Property(name="text", data_type=DataType.TEXT),
-    ],
-)
+    :return: collection
+    """
+    global client, _collection
+    if _collection is not None:
+        return _collection
+
+    options = settings['rag']
+    if options['host']:
+        client = weaviate.connect_to_local(host=options['host'], port=options['port'],
+                                           grpc_port=options['grpc_port'])
+    else:
+        if int(os.environ.get('LUMIN_WORKERS', 1)) > 1:
+            raise RuntimeError('an embedded Weaviate can\'t be shared by worker processes, set rag.host')
+        client = weaviate.connect_to_embedded()
+
+    name = options['collection']
+    if client.collections.exists(name):
+        _collection = client.collections.get(name)
+    else:
+        _collection = client.collections.create(
+            name,
+            properties=[
+                Property(name="text", data_type=DataType.TEXT),
+            ],
+        )
+    return _collection
 
 
 def chunk_doc(doc: str, max_len: int = 512) -> list:
@@ -40,6 +63,7 @@ def chunk_doc(doc: str, max_len: int = 512) -> list:
 
 def ingest_chunks(chunks: list[str]):
     # store each document in a vector embedding database
+    collection = connect()
     with collection.batch.dynamic() as batch:
         for i, d in enumerate(chunks):
             response = ollama_client.embeddings(model="all-minilm", prompt=d)
@@ -53,7 +77,7 @@ def ingest_chunks(chunks: list[str]):
 
 def query_docs(prompt: str) -> list[str]:
     response = ollama_client.embeddings(model="all-minilm", prompt=prompt)
-    results = collection.query.near_vector(near_vector=response["embedding"], limit=5)
+    results = connect().query.near_vector(near_vector=response["embedding"], limit=5)
     return [result.properties['text'] for result in results.objects]
 
 
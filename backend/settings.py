@@ -0,0 +1,112 @@
+"""
+Settings of the Lumin API server, loaded from config/lumin.yaml on top of the defaults below.
+"""
+
+import copy
+from pathlib import Path
+
+import yaml
+
+THIS_DIR = Path(__file__).parent
+SETTINGS_PATH = THIS_DIR / 'config' / 'lumin.yaml'
+
+DEFAULTS = {
+    'executor': {
+        'timeout': 120,
+        'deadline': None,
+    },
+    'cache': {
+        'size': 1024,
+        'ttl': 3600,
+        'path': None,
+    },
+    'scheduler': {
+        'default': {
+            'concurrency': 4,
+            'tokens_per_second': None,
+        },
+        'backends': {},
+    },
+    'memory': {
+        'capacity': 40,
+    },
+    'supervision': {
+        'policy': 'unanimous',
+        'quorum': None,
+    },
+    'parsing': {
+        'constrained': True,
+    },
+    'selection': {
+        'mode': 'score',
+        'tie_margin': 0.5,
+    },
+    'dedup': {
+        'enabled': True,
+        'threshold': 0.8,
+        'shingle': 3,
+        'permutations': 64,
+    },
+    'pool': {
+        'size': 8,
+        'shapes': [[2, 1]],
+    },
+    'sessions': {
+        'flush_interval': 0.5,
+        'cache_size': 256,
+        'cache_bytes': 64 * 1024 * 1024,
+        'cache_ttl': 3600,
+    },
+    'database': {
+        'workers': 4,
+        'queue': 64,
+    },
+    'event_loop': {
+        'interval': 0.1,
+        'threshold': 0.02,
+    },
+    'tracing': {
+        'buffer': 4096,
+        'opentelemetry': True,
+    },
+    'rag': {
+        'host': None,
+        'port': 8080,
+        'grpc_port': 50051,
+        'collection': 'docs',
+    },
+}
+
+
+def merge(base: dict, override: dict) -> dict:
+    """
+    Recursively merge override into a copy of base
+
+    :param base: base settings
+    :param override: settings overriding the base
+    :return: merged settings
+    """
+    merged = copy.deepcopy(base)
+    for key, value in (override or {}).items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def load(path: str | Path = SETTINGS_PATH) -> dict:
+    """
+    Load the settings
+
+    :param path: path of the settings file
+    :return: settings
+    """
+    path = Path(path)
+    if not path.exists():
+        return copy.deepcopy(DEFAULTS)
+    with open(path, 'r') as f:
+        return merge(DEFAULTS, yaml.safe_load(f))
+
+
+settings = load()
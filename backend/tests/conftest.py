@@ -0,0 +1,12 @@
+"""
+The tests run against temporary databases, never the ones of the server
+"""
+
+import os
+import tempfile
+from pathlib import Path
+
+_databases = tempfile.TemporaryDirectory(prefix='lumin-tests-')
+# set before any test module imports agents or configurations
+os.environ['LUMIN_SESSIONS_DB'] = str(Path(_databases.name) / 'sessions.sqlite')
+os.environ['LUMIN_CONFIGURATIONS_DB'] = str(Path(_databases.name) / 'database.sqlite')
@@ -0,0 +1,125 @@
+"""
+Unit tests for the response cache: TTL, LRU, coalescing, the disk tier and the scope of the supervisors
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from agents import cache, mock, templates
+from agents.agents import Team, ChatRole, SupervisorRole
+
+
+class Model:
+    """
+    Counts the calls made on cache misses
+    """
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.calls = 0
+
+    def __call__(self, response: str):
+        async def call() -> str:
+            self.calls += 1
+            await asyncio.sleep(self.delay)
+            return response
+        return call
+
+
+@pytest.fixture
+def mock_llm():
+    llm = mock.install(mock.MockLLM(latency='constant', latency_mean=0, tokens_per_second=None, approve=1.0))
+    cache.responses.clear()
+    yield llm
+    templates.set_provider(None)
+    cache.responses.clear()
+
+
+def test_key():
+    key = cache.ResponseCache.key('model', 'prompt', 'role')
+    assert key == cache.ResponseCache.key('model', 'prompt', 'role')
+    assert key != cache.ResponseCache.key('other', 'prompt', 'role')
+    assert key != cache.ResponseCache.key('model', 'other', 'role')
+    assert key != cache.ResponseCache.key('model', 'prompt', 'other')
+    assert key != cache.ResponseCache.key('model', 'prompt', 'role', 'Supervisor:1')
+
+
+def test_ttl():
+    responses = cache.ResponseCache(size=8, ttl=60)
+    responses.put('fresh', 'a')
+    responses.put('stale', 'b', created=time.time() - 61)
+    assert responses.get('fresh') == 'a'
+    assert responses.get('stale') is None
+    assert responses.stats()['entries'] == 1
+
+
+def test_lru():
+    responses = cache.ResponseCache(size=2)
+    responses.put('a', '1')
+    responses.put('b', '2')
+    # a is used, so b is the least recently used
+    assert responses.get('a') == '1'
+    responses.put('c', '3')
+    assert responses.get('b') is None
+    assert responses.get('a') == '1' and responses.get('c') == '3'
+
+
+def test_hit_and_miss():
+    async def run():
+        responses = cache.ResponseCache()
+        model = Model()
+        first = await responses.fetch('k', model('answer'))
+        second = await responses.fetch('k', model('other'))
+        return first, second, model.calls, responses.stats()
+
+    first, second, calls, stats = asyncio.run(run())
+    assert (first, second, calls) == ('answer', 'answer', 1)
+    assert (stats['hits'], stats['misses']) == (1, 1)
+
+
+def test_coalescing():
+    async def run():
+        responses = cache.ResponseCache()
+        model = Model(delay=0.05)
+        results = await asyncio.gather(*(responses.fetch('k', model('answer')) for _ in range(5)))
+        return results, model.calls, responses.stats()['coalesced']
+
+    assert asyncio.run(run()) == (['answer'] * 5, 1, 4)
+
+
+def test_coalesced_call_survives_cancelled_waiter():
+    async def run():
+        responses = cache.ResponseCache()
+        model = Model(delay=0.05)
+        first = asyncio.create_task(responses.fetch('k', model('answer')))
+        second = asyncio.create_task(responses.fetch('k', model('answer')))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second, model.calls
+
+    assert asyncio.run(run()) == ('answer', 1)
+
+
+def test_disk_tier(tmp_path):
+    async def run():
+        responses = cache.ResponseCache(path=tmp_path / 'responses.sqlite')
+        model = Model()
+        await responses.fetch('k', model('answer'))
+        # gone from memory, still on disk
+        responses._entries.clear()
+        return await responses.fetch('k', model('other')), model.calls
+
+    assert asyncio.run(run()) == ('answer', 1)
+
+
+def test_supervisor_seats(mock_llm):
+    # identical prompts of the supervisors of a team are independent samples, not shared responses
+    async def run():
+        await Team([ChatRole()], [SupervisorRole() for _ in range(3)])('hello')
+
+    asyncio.run(run())
+    assert mock_llm.calls['SuperviseAction'] == 3
+    assert cache.responses.stats()['coalesced'] == 0
+
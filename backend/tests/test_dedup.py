@@ -0,0 +1,46 @@
+"""
+Unit tests for the clustering of near-duplicate answers
+"""
+
+import pytest
+
+from agents import dedup
+
+PARIS = 'The capital of France is Paris, a city on the Seine with about two million inhabitants.'
+# one word changed: estimated similarity of about 0.58
+PARIS_2M = 'The capital of France is Paris, a city on the Seine with about 2 million inhabitants.'
+BERLIN = 'Berlin is the capital of Germany and its largest city by population.'
+
+
+def test_normalized_duplicates():
+    # case, punctuation and spacing don't matter, even at the strictest threshold
+    texts = [PARIS, PARIS.upper(), PARIS.replace(',', ' ,  '), BERLIN]
+    assert dedup.cluster(texts, threshold=1.0) == [[0, 1, 2], [3]]
+
+
+@pytest.mark.parametrize('threshold, clusters', [
+    (1.0, [[0], [1], [2]]),
+    (0.8, [[0], [1], [2]]),
+    (0.5, [[0, 1], [2]]),
+    (0.0, [[0, 1, 2]]),
+])
+def test_threshold(threshold, clusters):
+    assert dedup.cluster([PARIS, PARIS_2M, BERLIN], threshold=threshold) == clusters
+
+
+def test_similarity():
+    paris, paris_2m, berlin = (dedup.signature(text) for text in (PARIS, PARIS_2M, BERLIN))
+    assert dedup.similarity(paris, paris) == 1.0
+    assert dedup.similarity(paris, berlin) < 0.2 < dedup.similarity(paris, paris_2m) < 0.8
+
+
+def test_none_left_out():
+    assert dedup.cluster([None, PARIS, None, PARIS.lower()]) == [[1, 3]]
+    assert dedup.cluster([None, None]) == []
+
+
+def test_representative_first():
+    # a text joins the first cluster it is similar enough to, compared with the representative only
+    clusters = dedup.cluster([BERLIN, PARIS, PARIS_2M, PARIS], threshold=0.5)
+    assert clusters == [[0], [1, 2, 3]]
+    assert [cluster[0] for cluster in clusters] == [0, 1]
@@ -0,0 +1,50 @@
+"""
+Unit tests for the bounded memory of the chat agents
+"""
+
+import pickle
+
+from agents.memory import Memory
+
+
+def test_bound():
+    memory = Memory(capacity=3)
+    for i in range(5):
+        memory.append(f'turn {i}')
+    # the oldest turns are dropped
+    assert len(memory) == 3
+    assert list(memory) == ['turn 2', 'turn 3', 'turn 4']
+
+
+def test_initial_turns_bounded():
+    assert list(Memory([f'turn {i}' for i in range(5)], capacity=2)) == ['turn 3', 'turn 4']
+
+
+def test_unbounded():
+    memory = Memory(capacity=None)
+    for i in range(100):
+        memory.append(f'turn {i}')
+    assert len(memory) == 100
+    assert memory.capacity is None
+
+
+def test_last():
+    memory = Memory(['a', 'b', 'c', 'd'], capacity=10)
+    assert memory.last(2) == ['c', 'd']
+    assert memory.last() == ['a', 'b', 'c', 'd']
+    assert memory.last(10) == ['a', 'b', 'c', 'd']
+
+
+def test_clear():
+    memory = Memory(['a', 'b'], capacity=2)
+    memory.clear()
+    assert len(memory) == 0
+    memory.append('c')
+    assert list(memory) == ['c']
+
+
+def test_pickle_keeps_bound():
+    memory = pickle.loads(pickle.dumps(Memory(['a', 'b', 'c'], capacity=3)))
+    assert memory.capacity == 3
+    memory.append('d')
+    assert list(memory) == ['b', 'c', 'd']
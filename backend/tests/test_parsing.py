@@ -0,0 +1,90 @@
+"""
+Unit tests for the tolerant JSON parsing of model output
+
+    python -m pytest tests
+"""
+
+import pytest
+from pydantic import BaseModel
+
+from agents import parsing
+
+
+class Verdict(BaseModel):
+    correct: bool
+    reason: str = ''
+
+
+class Item(BaseModel):
+    index: int
+    correct: bool
+
+
+def test_plain():
+    assert parsing.parse('{"correct": true, "reason": "ok"}', Verdict) == Verdict(correct=True, reason='ok')
+
+
+def test_prose():
+    text = 'Sure, here is my verdict: {"correct": false, "reason": "wrong year"} Hope this helps!'
+    assert parsing.parse(text, Verdict) == Verdict(correct=False, reason='wrong year')
+
+
+def test_code_fence():
+    text = 'My verdict:\n```json\n[{"index": 0, "correct": true},\n {"index": 1, "correct": false}]\n```\n'
+    assert parsing.parse(text, list[Item]) == [Item(index=0, correct=True), Item(index=1, correct=False)]
+
+
+def test_python_literals():
+    text = "Verdict: {'correct': False, 'reason': None}"
+    assert parsing.extract(text) == {'correct': False, 'reason': None}
+    assert parsing.parse("{'correct': True, 'reason': 'it\\'s right',}", Verdict) == \
+        Verdict(correct=True, reason="it's right")
+
+
+def test_truncated():
+    assert parsing.parse('{"correct": true, "reason": "the answer is', Verdict) == \
+        Verdict(correct=True, reason='the answer is')
+    assert parsing.parse('[{"index": 0, "correct": true}, {"index": 1, "correct": false}', list[Item]) == \
+        [Item(index=0, correct=True), Item(index=1, correct=False)]
+    # cut in the middle of a literal: only the complete inner object is left, which is no list
+    with pytest.raises(parsing.ParseError):
+        parsing.parse('[{"index": 0, "correct": true}, {"index": 1, "correct": fal', list[Item])
+
+
+def test_bracketed_prose():
+    # the first candidate is valid JSON but not a verdict, the second one is
+    text = 'The answer cites [1] correctly. {"correct": true, "reason": ""}'
+    assert parsing.extract(text) == [1]
+    assert parsing.parse(text, Verdict) == Verdict(correct=True)
+    assert parsing.parse('See [1] and [2]: [{"index": 0, "correct": true}]', list[Item]) == \
+        [Item(index=0, correct=True)]
+
+
+def test_values_order():
+    assert list(parsing.values('a [1] b {"x": 2} c')) == [[1], {'x': 2}]
+
+
+def test_no_json():
+    with pytest.raises(parsing.ParseError):
+        parsing.extract('I cannot judge this answer.')
+    with pytest.raises(parsing.ParseError):
+        parsing.parse('I cannot judge this answer.', Verdict)
+
+
+def test_invalid():
+    with pytest.raises(parsing.ParseError):
+        parsing.parse('[1] and {"reason": "missing verdict"}', Verdict)
+
+
+@pytest.mark.parametrize('text, expected', [
+    ("{'a': 'b'}", '{"a": "b"}'),
+    ('{"a": True, "b": None}', '{"a": true, "b": null}'),
+    ('{a: 1}', '{"a": 1}'),
+    ('[1, 2, ]', '[1, 2]'),
+    ('{"a": 1,}', '{"a": 1}'),
+    ('{“a”: “b”}', '{"a": "b"}'),
+    ("{'a': 'say \"hi\"'}", '{"a": "say \\"hi\\""}'),
+    ("{'a': 'it\\'s'}", '{"a": "it\'s"}'),
+])
+def test_repair(text, expected):
+    assert parsing.repair(text) == expected
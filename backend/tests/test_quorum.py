@@ -0,0 +1,103 @@
+"""
+Unit tests for the supervision policies of Team: when the outcome of the verdicts is decided
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from agents import Team
+
+APPROVE = {"correct": True, "reason": ""}
+REJECT = {"correct": False, "reason": "wrong"}
+
+
+class Supervisor:
+    """
+    Stand-in for SupervisorRole: answers with a fixed verdict after a delay
+    """
+
+    def __init__(self, verdict: dict, delay: float = 0.0):
+        self.verdict = verdict
+        self.delay = delay
+        self.seat = 0
+        self.cancelled = False
+
+    async def run(self, **kwargs) -> SimpleNamespace:
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        # like the Message of SupervisorRole.run, with the parsed verdict as content
+        return SimpleNamespace(content=self.verdict)
+
+
+def team(policy: str, supervisors: int, quorum: int | None = None) -> Team:
+    return Team([], [Supervisor(APPROVE) for _ in range(supervisors)], policy=policy, quorum=quorum)
+
+
+@pytest.mark.parametrize('feedbacks, decided', [
+    ([], None),
+    ([APPROVE, APPROVE], None),
+    ([APPROVE, APPROVE, APPROVE], True),
+    ([REJECT], False),
+    ([APPROVE, APPROVE, REJECT], False),
+])
+def test_unanimous(feedbacks, decided):
+    assert team('unanimous', 3)._Team__decided(feedbacks) is decided
+
+
+@pytest.mark.parametrize('feedbacks, decided', [
+    ([APPROVE], None),
+    ([APPROVE, REJECT], None),
+    ([APPROVE, APPROVE], True),
+    ([REJECT, REJECT], False),
+    ([APPROVE, REJECT, REJECT], False),
+])
+def test_majority(feedbacks, decided):
+    assert team('majority', 3)._Team__decided(feedbacks) is decided
+
+
+@pytest.mark.parametrize('feedbacks, decided', [
+    ([APPROVE], None),
+    ([APPROVE, APPROVE], True),
+    ([REJECT, REJECT], None),
+    ([REJECT, REJECT, REJECT], False),
+    ([REJECT, APPROVE, REJECT, APPROVE], True),
+])
+def test_k_of_n(feedbacks, decided):
+    assert team('k_of_n', 4, quorum=2)._Team__decided(feedbacks) is decided
+
+
+def test_k_of_n_quorum_capped():
+    # a quorum larger than the team needs every supervisor
+    t = team('k_of_n', 2, quorum=5)
+    assert t._Team__decided([APPROVE]) is None
+    assert t._Team__decided([APPROVE, APPROVE]) is True
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        team('most', 3)
+
+
+def test_remaining_supervisors_cancelled():
+    supervisors = [Supervisor(APPROVE, 0.01), Supervisor(APPROVE, 0.02), Supervisor(APPROVE, 5)]
+    t = Team([], supervisors, policy='majority')
+
+    async def run():
+        return await asyncio.wait_for(t._Team__supervisors_run('prompt', 'answer', ''), 2)
+
+    feedbacks = asyncio.run(run())
+    assert feedbacks == [APPROVE, APPROVE]
+    assert [supervisor.cancelled for supervisor in supervisors] == [False, False, True]
+
+
+def test_rejection_cancels_remaining():
+    supervisors = [Supervisor(REJECT, 0.01), Supervisor(APPROVE, 5), Supervisor(APPROVE, 5)]
+    t = Team([], supervisors, policy='unanimous')
+    feedbacks = asyncio.run(t._Team__supervisors_run('prompt', 'answer', ''))
+    assert feedbacks == [REJECT]
+    assert [supervisor.cancelled for supervisor in supervisors] == [False, True, True]
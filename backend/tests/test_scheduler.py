@@ -0,0 +1,125 @@
+"""
+Unit tests for the LLM call scheduler: priorities, round robin across sessions and the token bucket
+"""
+
+import asyncio
+import time
+
+from agents import scheduler
+
+
+async def call(backend: scheduler.Scheduler, order: list, name: str, level: int = scheduler.STATELESS,
+               session_key: str | None = None, tokens: int = 0, hold: asyncio.Event | None = None) -> None:
+    scheduler.enter(level, session_key)
+    async with backend.slot(tokens):
+        order.append(name)
+        if hold:
+            await hold.wait()
+
+
+async def queued(backend: scheduler.Scheduler, calls: list[tuple]) -> list[str]:
+    """
+    Order in which the calls get their slot while a first call holds the only slot
+
+    :param backend: scheduler with a concurrency of 1
+    :param calls: arguments of call after the name: (name, level, session_key)
+    :return: names in the order of the slots
+    """
+    order: list[str] = list()
+    hold = asyncio.Event()
+    first = asyncio.create_task(call(backend, order, 'first', hold=hold))
+    await asyncio.sleep(0)
+    tasks = [asyncio.create_task(call(backend, order, *args)) for args in calls]
+    await asyncio.sleep(0)
+    assert backend.waiting == len(calls)
+    hold.set()
+    await asyncio.gather(first, *tasks)
+    return order[1:]
+
+
+def test_priority():
+    async def run():
+        backend = scheduler.Scheduler('test', concurrency=1)
+        return await queued(backend, [
+            ('background', scheduler.BACKGROUND),
+            ('stateless', scheduler.STATELESS),
+            ('interactive', scheduler.INTERACTIVE),
+        ])
+
+    assert asyncio.run(run()) == ['interactive', 'stateless', 'background']
+
+
+def test_sessions_take_turns():
+    async def run():
+        backend = scheduler.Scheduler('test', concurrency=1)
+        return await queued(backend, [
+            ('a1', scheduler.INTERACTIVE, 'a'),
+            ('a2', scheduler.INTERACTIVE, 'a'),
+            ('a3', scheduler.INTERACTIVE, 'a'),
+            ('b1', scheduler.INTERACTIVE, 'b'),
+            ('c1', scheduler.INTERACTIVE, 'c'),
+        ])
+
+    # a session with many calls doesn't hold up the others
+    assert asyncio.run(run()) == ['a1', 'b1', 'c1', 'a2', 'a3']
+
+
+def test_concurrency():
+    async def run():
+        backend = scheduler.Scheduler('test', concurrency=2)
+        order: list[str] = list()
+        hold = asyncio.Event()
+        tasks = [asyncio.create_task(call(backend, order, str(i), hold=hold)) for i in range(3)]
+        await asyncio.sleep(0.01)
+        in_flight, waiting = len(order), backend.waiting
+        hold.set()
+        await asyncio.gather(*tasks)
+        return in_flight, waiting, backend.stats()['in_flight']
+
+    assert asyncio.run(run()) == (2, 1, 0)
+
+
+def test_cancelled_ticket_skipped():
+    async def run():
+        backend = scheduler.Scheduler('test', concurrency=1)
+        order: list[str] = list()
+        hold = asyncio.Event()
+        first = asyncio.create_task(call(backend, order, 'first', hold=hold))
+        await asyncio.sleep(0)
+        cancelled = asyncio.create_task(call(backend, order, 'cancelled'))
+        second = asyncio.create_task(call(backend, order, 'second'))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        hold.set()
+        await asyncio.gather(first, second)
+        return order, backend.stats()['in_flight']
+
+    assert asyncio.run(run()) == (['first', 'second'], 0)
+
+
+def test_token_bucket():
+    async def run():
+        backend = scheduler.Scheduler('test', concurrency=8, tokens_per_second=1000)
+        order: list[str] = list()
+        # the bucket holds one second worth of tokens, the first call uses them up
+        await call(backend, order, 'first', tokens=1000)
+        start = time.monotonic()
+        # response tokens are charged after the call
+        async with backend.slot(0) as slot:
+            slot.charge(200)
+        await call(backend, order, 'second', tokens=10)
+        return time.monotonic() - start
+
+    # -200 tokens plus one token refilled at 1000 tokens per second
+    assert 0.15 < asyncio.run(run()) < 1
+
+
+def test_no_limit():
+    async def run():
+        backend = scheduler.Scheduler('test', concurrency=8)
+        order: list[str] = list()
+        start = time.monotonic()
+        await asyncio.gather(*(call(backend, order, str(i), tokens=10 ** 6) for i in range(8)))
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) < 0.1
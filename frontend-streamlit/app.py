@@ -21,10 +21,19 @@ def initialize_session(agent_count=3, supervisor_count=1):
     return config_key, session_key
 
 
-# Function to fetch the list of sessions
-def fetch_sessions():
-    response = requests.get(url + 'session/list')
-    return response.json()
+# Function to fetch the list of sessions (only the sessions created since the last rerun are requested)
+def fetch_sessions(page_size=500):
+    if "session_keys" not in st.session_state:
+        st.session_state.session_keys, st.session_state.session_cursor = [], None
+    while True:
+        params = {'limit': page_size}
+        if st.session_state.session_cursor is not None:
+            params['after'] = st.session_state.session_cursor
+        page = requests.get(url + 'session/list', params=params).json()
+        st.session_state.session_keys.extend(page["sessions"])
+        st.session_state.session_cursor = page["after"]
+        if len(page["sessions"]) < page_size:
+            return list(st.session_state.session_keys)
 
 
 # Function to read messages from a session